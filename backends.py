@@ -0,0 +1,751 @@
+"""Decryption backends for reading pass entries."""
+import asyncio
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+# Substrings of gpg/pass error output (lowercased) and the failure reason they indicate
+FAILURE_REASONS = [
+    ("no secret key", "no-secret-key"),
+    ("bad passphrase", "bad-passphrase"),
+    ("pinentry", "pinentry"),
+    ("inappropriate ioctl for device", "pinentry"),
+    ("operation cancelled", "pinentry"),
+    ("can't connect to the agent", "agent"),
+    ("no agent running", "agent"),
+    ("problem with the agent", "agent"),
+    ("resource temporarily unavailable", "agent"),
+    # --status-fd keywords; gpg's message can be less precise, e.g. "No secret
+    # key" after a pinentry that could not ask for the passphrase
+    ("pinentry_launched", "pinentry"),
+    ("missing_passphrase", "pinentry"),
+    ("bad_passphrase", "bad-passphrase"),
+    ("no_seckey", "no-secret-key"),
+]
+
+def classify_failure(message: str) -> str:
+    """Map gpg/pass error output to a short failure reason, or "other"."""
+    lowered = message.lower()
+    for needle, reason in FAILURE_REASONS:
+        if needle in lowered:
+            return reason
+    return "other"
+
+class DecryptionError(Exception):
+    """Why an entry could not be decrypted; str() is the message to print."""
+
+    def __init__(self, entry_name: str, message: str, reason: str):
+        super().__init__(message)
+        self.entry_name = entry_name
+        self.reason = reason
+
+    @classmethod
+    def from_stderr(cls, entry_name: str, stderr: str) -> "DecryptionError":
+        """Failure reported by gpg or pass on stderr."""
+        return cls(entry_name, f"Error reading {entry_name}: {stderr}", classify_failure(stderr))
+
+    @classmethod
+    def from_timeout(cls, entry_name: str) -> "DecryptionError":
+        """Decryption did not finish in time."""
+        return cls(entry_name, f"Timeout reading {entry_name}", "timeout")
+
+    @classmethod
+    def from_exception(cls, entry_name: str, exc: Exception) -> "DecryptionError":
+        """Decryption could not be run at all."""
+        return cls(entry_name, f"Exception reading {entry_name}: {exc}", classify_failure(str(exc)))
+
+class BackendUnavailableError(RuntimeError):
+    """Raised by DecryptionBackend.open() when the backend cannot decrypt anything."""
+
+ErrorHandler = Callable[[DecryptionError], None]
+
+def _report(error: DecryptionError, on_error: Optional[ErrorHandler]):
+    """Pass a failure to `on_error`, or print it when there is no handler."""
+    if on_error is None:
+        print(error)
+    else:
+        on_error(error)
+
+def pass_env() -> dict:
+    """Build the environment for pass subprocesses, with GPG_TTY set."""
+    env = os.environ.copy()
+    env["GPG_TTY"] = subprocess.run(
+        ["tty"], capture_output=True, text=True, check=False
+    ).stdout.strip()
+    return env
+
+def read_pass(entry_name, on_error: Optional[ErrorHandler] = None, timeout: float = 30):
+    """
+    Read a password entry from the pass store.
+
+    Failures are printed, or passed to `on_error` as a DecryptionError. The
+    `pass` process is given `timeout` seconds to finish.
+    """
+    env = pass_env()
+
+    try:
+        result = subprocess.run(
+            ["pass", entry_name],
+            capture_output=True,
+            text=True,
+            env=env,
+            timeout=timeout,  # Add timeout to prevent hanging
+            check=False
+        )
+
+        if result.returncode != 0:
+            _report(DecryptionError.from_stderr(entry_name, result.stderr), on_error)
+            return None
+
+        return result.stdout.strip()
+    except subprocess.TimeoutExpired:
+        _report(DecryptionError.from_timeout(entry_name), on_error)
+        return None
+    except (subprocess.SubprocessError, OSError) as e:
+        _report(DecryptionError.from_exception(entry_name, e), on_error)
+        return None
+
+def read_gpg(entry_name: str, path: str, env: Optional[dict] = None,
+             on_error: Optional[ErrorHandler] = None, timeout: float = 30) -> Optional[str]:
+    """
+    Decrypt a store file with gpg directly, bypassing the pass shell script.
+
+    Returns the same content read_pass would for `entry_name`, or None on failure.
+    """
+    if env is None:
+        env = pass_env()
+
+    try:
+        result = subprocess.run(
+            ["gpg", "--quiet", "--batch", "--decrypt", path],
+            capture_output=True,
+            text=True,
+            env=env,
+            timeout=timeout,
+            check=False
+        )
+
+        if result.returncode != 0:
+            _report(DecryptionError.from_stderr(entry_name, result.stderr), on_error)
+            return None
+
+        return result.stdout.strip()
+    except subprocess.TimeoutExpired:
+        _report(DecryptionError.from_timeout(entry_name), on_error)
+        return None
+    except (subprocess.SubprocessError, OSError) as e:
+        _report(DecryptionError.from_exception(entry_name, e), on_error)
+        return None
+
+def _shared_memory_dir() -> Optional[str]:
+    """/dev/shm if it exists and is writable, else None."""
+    shm = "/dev/shm"
+    return shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else None
+
+def _batch_tempdir() -> tempfile.TemporaryDirectory:
+    """
+    Private scratch directory for batch plaintext, in RAM when /dev/shm exists.
+
+    Elsewhere, as on macOS, it is in the normal temporary directory, so
+    plaintext briefly reaches the disk.
+    """
+    return tempfile.TemporaryDirectory(prefix="pass2protonpass-", dir=_shared_memory_dir())
+
+def _split_decrypt_files_output(output: str) -> Tuple[set, Dict[str, List[str]]]:
+    """
+    Split the merged status and log output of gpg --decrypt-files by file.
+
+    Returns the names (without .gpg) of the files gpg reported as decrypted,
+    and for every file it started on, the lines it printed for that file.
+    gpg does not always name the file in its messages ("decryption failed:
+    No secret key"), so they are attributed by their place between the
+    file's FILE_START and FILE_DONE.
+    """
+    decrypted = set()
+    lines: Dict[str, List[str]] = {}
+    current = None
+    for line in output.splitlines():
+        fields = line.split()
+        if fields[:2] == ["[GNUPG:]", "FILE_START"] and len(fields) >= 4:
+            current = fields[3][:-len(".gpg")]
+            lines[current] = []
+        elif fields[:2] == ["[GNUPG:]", "FILE_DONE"]:
+            current = None
+        elif current is not None and fields:
+            lines[current].append(line)
+            if fields[:2] == ["[GNUPG:]", "DECRYPTION_OKAY"]:
+                decrypted.add(current)
+    return decrypted, lines
+
+def _batch_failure(entry_name: str, lines: List[str]) -> DecryptionError:
+    """Failure of one file of a batch, from the status and log lines gpg printed for it."""
+    status_prefix = "[GNUPG:] "
+    messages = [line for line in lines if not line.startswith(status_prefix)]
+    status = [line[len(status_prefix):] for line in lines if line.startswith(status_prefix)]
+    if messages:
+        message = " ".join(messages)
+    elif status:
+        message = "gpg reported " + "; ".join(status)
+    else:
+        message = "decryption failed"
+    reason = classify_failure("\n".join(status))
+    if reason == "other":
+        reason = classify_failure(message)
+    return DecryptionError(entry_name, f"Error reading {entry_name}: {message}", reason)
+
+def _collect_batch_output(workdir: str, entries: List[Tuple[str, str]],
+                          output: str, finished: bool,
+                          on_error: Optional[ErrorHandler]) -> List[Optional[str]]:
+    """
+    Read and remove each decrypted output of a gpg --decrypt-files run.
+
+    `output` is gpg's merged status and log output; `finished` is False when
+    gpg timed out before finishing the batch.
+    """
+    results: List[Optional[str]] = []
+    decrypted, lines = _split_decrypt_files_output(output)
+    for index, (entry_name, _) in enumerate(entries):
+        output_path = os.path.join(workdir, str(index))
+        content = None
+        if str(index) in decrypted and os.path.exists(output_path):
+            with open(output_path, encoding="utf-8") as f:
+                content = f.read().strip()
+        elif not finished:
+            _report(DecryptionError.from_timeout(entry_name), on_error)
+        else:
+            _report(_batch_failure(entry_name, lines.get(str(index), [])), on_error)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        results.append(content)
+    return results
+
+def read_gpg_batch(entries: List[Tuple[str, str]], env: Optional[dict] = None,
+                   on_error: Optional[ErrorHandler] = None,
+                   timeout: float = 30) -> List[Optional[str]]:
+    """
+    Decrypt a batch of store files with a single gpg --decrypt-files process.
+
+    `entries` holds (entry_name, path) pairs; the result holds one content (or
+    None) per pair, in the same order. A file that fails to decrypt only marks
+    its own entry as failed. Plaintext goes to a private temporary directory
+    and is removed as soon as it has been read.
+    """
+    if not entries:
+        return []
+    if env is None:
+        env = pass_env()
+
+    with _batch_tempdir() as workdir:
+        # gpg strips ".gpg" to name each output file, so link inputs by index
+        links = []
+        for index, (_, path) in enumerate(entries):
+            link = f"{index}.gpg"
+            os.symlink(os.path.abspath(path), os.path.join(workdir, link))
+            links.append(link)
+
+        try:
+            proc = subprocess.run(
+                ["gpg", "--quiet", "--batch", "--yes", "--status-fd", "1",
+                 "--decrypt-files", *links],
+                stdout=subprocess.PIPE,
+                # Merged so messages stay between their file's status lines
+                stderr=subprocess.STDOUT,
+                text=True,
+                env=env,
+                cwd=workdir,
+                # Allow the per-entry decryption time on top of gpg's startup
+                timeout=timeout + len(entries),
+                check=False
+            )
+            output, finished = proc.stdout, True
+        except subprocess.TimeoutExpired as e:
+            print(f"Timeout decrypting batch of {len(entries)} entries")
+            output = e.stdout.decode() if isinstance(e.stdout, bytes) else (e.stdout or "")
+            finished = False
+        except (subprocess.SubprocessError, OSError) as e:
+            for entry_name, _ in entries:
+                _report(DecryptionError.from_exception(entry_name, e), on_error)
+            return [None] * len(entries)
+
+        return _collect_batch_output(workdir, entries, output, finished, on_error)
+
+def _decode_plaintext(data: bytes) -> str:
+    """Decode plaintext exactly as subprocess.run(text=True) would, then strip it."""
+    content = data.decode("utf-8")
+    # Match the universal newline handling of text mode
+    return content.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+class SessionKeyCache:
+    """
+    Map from ciphertext SHA-256 to the OpenPGP session key that decrypts it.
+
+    The cache is kept on disk encrypted to the user's own key
+    (gpg --default-recipient-self), so it is no more exposed than the store.
+    A cached key lets gpg skip the public-key step and the agent round-trip
+    for files whose ciphertext has not changed since the last run. Only the
+    keys of ciphertexts read during the run are saved again, so keys of
+    entries that were edited or deleted do not pile up.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._keys: Dict[str, str] = {}
+        # Digests looked up or added during this run
+        self._seen: Set[str] = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def load(self, env: Optional[dict] = None):
+        """Decrypt and load the cache file, starting empty if there is none."""
+        if not os.path.exists(self.path):
+            return
+        result = subprocess.run(
+            ["gpg", "--quiet", "--batch", "--decrypt", self.path],
+            capture_output=True,
+            text=True,
+            env=env,
+            timeout=30,
+            check=False
+        )
+        if result.returncode != 0:
+            print(f"Could not read session key cache {self.path}: {result.stderr}")
+            return
+        try:
+            self._keys = json.loads(result.stdout)
+        except ValueError:
+            print(f"Ignoring corrupt session key cache {self.path}")
+
+    def save(self, env: Optional[dict] = None):
+        """Encrypt the cache back to disk if keys were added or dropped."""
+        with self._lock:
+            stale = set(self._keys) - self._seen
+            for digest in stale:
+                del self._keys[digest]
+            self._dirty = self._dirty or bool(stale)
+        if not self._dirty:
+            return
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, mode=0o700)
+
+        tmp_path = self.path + ".tmp"
+        result = subprocess.run(
+            ["gpg", "--quiet", "--batch", "--yes", "--encrypt",
+             "--default-recipient-self", "--output", tmp_path],
+            input=json.dumps(self._keys),
+            capture_output=True,
+            text=True,
+            env=env,
+            timeout=30,
+            check=False
+        )
+        if result.returncode != 0:
+            print(f"Could not write session key cache {self.path}: {result.stderr}")
+            return
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def get(self, digest: str) -> Optional[str]:
+        """Return the session key cached for a ciphertext digest, if any."""
+        with self._lock:
+            self._seen.add(digest)
+            return self._keys.get(digest)
+
+    def put(self, digest: str, session_key: str):
+        """Remember the session key for a ciphertext digest."""
+        with self._lock:
+            self._seen.add(digest)
+            if self._keys.get(digest) != session_key:
+                self._keys[digest] = session_key
+                self._dirty = True
+
+    def read_entry(self, entry_name: str, path: str, env: Optional[dict] = None,
+                   on_error: Optional[ErrorHandler] = None, timeout: float = 30) -> Optional[str]:
+        """
+        Like read_gpg, but reuse and record session keys in this cache.
+
+        Files whose ciphertext hash is cached are decrypted with
+        --override-session-key; everything else is decrypted normally with
+        --show-session-key and its key added to the cache.
+        """
+        try:
+            with open(path, "rb") as f:
+                ciphertext = f.read()
+            digest = hashlib.sha256(ciphertext).hexdigest()
+
+            session_key = self.get(digest)
+            if session_key:
+                plaintext = _gpg_with_session_key(ciphertext, session_key, env, timeout)
+                if plaintext is not None:
+                    return _decode_plaintext(plaintext)
+
+            result = subprocess.run(
+                ["gpg", "--quiet", "--batch", "--decrypt", "--show-session-key"],
+                input=ciphertext,
+                capture_output=True,
+                env=env,
+                timeout=timeout,
+                check=False
+            )
+            stderr = result.stderr.decode(errors="replace")
+            if result.returncode != 0:
+                _report(DecryptionError.from_stderr(entry_name, stderr), on_error)
+                return None
+
+            for line in stderr.splitlines():
+                if "session key: '" in line:
+                    self.put(digest, line.split("'")[1])
+                    break
+            return _decode_plaintext(result.stdout)
+        except subprocess.TimeoutExpired:
+            _report(DecryptionError.from_timeout(entry_name), on_error)
+            return None
+        except (subprocess.SubprocessError, OSError, UnicodeDecodeError) as e:
+            _report(DecryptionError.from_exception(entry_name, e), on_error)
+            return None
+
+def _gpg_with_session_key(ciphertext: bytes, session_key: str,
+                          env: Optional[dict], timeout: float) -> Optional[bytes]:
+    """Decrypt with a known session key; returns plaintext or None if it does not apply."""
+    # Hand the key over a pipe so it never appears in the process list
+    read_fd, write_fd = os.pipe()
+    try:
+        os.write(write_fd, (session_key + "\n").encode())
+        os.close(write_fd)
+        write_fd = None
+        result = subprocess.run(
+            ["gpg", "--quiet", "--batch", "--decrypt",
+             "--override-session-key-fd", str(read_fd)],
+            input=ciphertext,
+            capture_output=True,
+            env=env,
+            timeout=timeout,
+            pass_fds=(read_fd,),
+            check=False
+        )
+    finally:
+        os.close(read_fd)
+        if write_fd is not None:
+            os.close(write_fd)
+    # stderr echoes the session key in debug output, so it is never printed
+    return result.stdout if result.returncode == 0 else None
+
+class InProcessDecryptor:
+    """
+    Decrypt store files in-process with PGPy, without spawning gpg or pass.
+
+    The secret key is loaded from an ASCII-armored export (for example
+    `gpg --export-secret-keys --armor KEYID > key.asc`) and unlocked once with
+    `passphrase`. Requires the optional `PGPy` package.
+    """
+
+    def __init__(self, secret_key_file: str, passphrase: Optional[str] = None):
+        try:
+            self._pgpy = importlib.import_module("pgpy")
+        except ImportError as e:
+            raise BackendUnavailableError(
+                "The in-process backend requires PGPy: pip install PGPy"
+            ) from e
+
+        if not secret_key_file:
+            raise BackendUnavailableError(
+                "Set GPG_SECRET_KEY_FILE to an ASCII-armored export of your secret key")
+        try:
+            self._key, _ = self._pgpy.PGPKey.from_file(os.path.expanduser(secret_key_file))
+        except (OSError, ValueError, NotImplementedError, self._pgpy.errors.PGPError) as e:
+            raise BackendUnavailableError(
+                f"Cannot read the secret key {secret_key_file}: {e}") from e
+
+        self._unlocked = None
+        if self._key.is_protected:
+            if not passphrase:
+                raise BackendUnavailableError(
+                    "A passphrase is required to unlock the secret key")
+            # Keep the key unlocked for the whole run instead of once per entry
+            self._unlocked = self._key.unlock(passphrase)
+            try:
+                self._unlocked.__enter__()  # pylint: disable=unnecessary-dunder-call
+            except self._pgpy.errors.PGPDecryptionError as e:
+                raise BackendUnavailableError(
+                    f"The passphrase does not unlock {secret_key_file}") from e
+
+    def decrypt(self, entry_name: str, path: str,
+                on_error: Optional[ErrorHandler] = None) -> Optional[str]:
+        """Decrypt one store file; returns the same text as read_gpg, or None."""
+        try:
+            message = self._pgpy.PGPMessage.from_file(path)
+            content = self._key.decrypt(message).message
+        except (OSError, ValueError, NotImplementedError, self._pgpy.errors.PGPError) as e:
+            _report(DecryptionError.from_stderr(entry_name, str(e)), on_error)
+            return None
+
+        if isinstance(content, (bytes, bytearray)):
+            return _decode_plaintext(bytes(content))
+        return _decode_plaintext(content.encode("utf-8"))
+
+    def close(self):
+        """Lock the secret key again."""
+        if self._unlocked is not None:
+            self._unlocked.__exit__(None, None, None)
+            self._unlocked = None
+
+def _kill_process_group(pid: int):
+    """Kill a process started with start_new_session=True and everything it started."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def read_pass_async(entry_name: str, env: Optional[dict] = None, timeout: float = 30,
+                          on_error: Optional[ErrorHandler] = None) -> Optional[str]:
+    """
+    Read a password entry from the pass store without blocking the event loop.
+
+    Mirrors read_pass: returns the stripped entry content, or None on failure.
+    The `pass` process is killed if it has not finished within `timeout` seconds,
+    or if the read is cancelled, together with the gpg it started, which would
+    otherwise keep running. Being in its own session, it does not get a
+    terminal's Ctrl-C.
+    """
+    if env is None:
+        env = pass_env()
+
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "pass", entry_name,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            # Its own process group, so a timeout can kill gpg as well
+            start_new_session=True
+        )
+    except OSError as e:
+        _report(DecryptionError.from_exception(entry_name, e), on_error)
+        return None
+
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        _kill_process_group(proc.pid)
+        await proc.wait()
+        _report(DecryptionError.from_timeout(entry_name), on_error)
+        return None
+    except BaseException:
+        # Cancelled, e.g. by a service shutting down: do not leave pass and gpg behind
+        _kill_process_group(proc.pid)
+        await proc.wait()
+        raise
+
+    if proc.returncode != 0:
+        _report(DecryptionError.from_stderr(entry_name, stderr.decode(errors="replace")),
+                on_error)
+        return None
+
+    return stdout.decode().strip()
+
+
+
+class DecryptionBackend:
+    """
+    Base class for decryption backends.
+
+    A backend is opened once per run, asked to decrypt entries one at a time
+    or in batches of `batch_size`, and closed afterwards. Entries are given as
+    (entry_name, path) pairs, where path is the entry's `.gpg` file; failures
+    are reported and returned as None so one bad entry never stops a run.
+    """
+
+    name = ""
+    batch_size = 1
+    # Called with a DecryptionError for each failed entry; failures are printed when unset
+    on_error: Optional[ErrorHandler] = None
+    # Seconds each decryption may take before it is reported as a timeout
+    timeout: float = 30
+
+    def open(self):
+        """
+        Acquire whatever the backend needs for the run.
+
+        Raises BackendUnavailableError if the backend cannot run at all.
+        """
+
+    def decrypt_one(self, entry_name: str, path: str) -> Optional[str]:
+        """Decrypt a single entry, returning its content or None on failure."""
+        raise NotImplementedError
+
+    def decrypt_many(self, entries: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """Decrypt several entries, returning their contents in the same order."""
+        return [self.decrypt_one(entry_name, path) for entry_name, path in entries]
+
+    def close(self):
+        """Release resources acquired by open()."""
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PassBackend(DecryptionBackend):
+    """Decrypt entries through the `pass` CLI."""
+
+    name = "pass"
+
+    def decrypt_one(self, entry_name: str, path: str) -> Optional[str]:
+        return read_pass(entry_name, on_error=self.on_error, timeout=self.timeout)
+
+
+class GpgBackend(DecryptionBackend):
+    """
+    Decrypt entries by running gpg directly on each store file.
+
+    With `session_key_cache` set to a file path, session keys are reused
+    across runs (see SessionKeyCache).
+    """
+
+    name = "gpg"
+
+    def __init__(self, session_key_cache: Optional[str] = None):
+        self._env: Optional[dict] = None
+        self._cache = SessionKeyCache(session_key_cache) if session_key_cache else None
+
+    def open(self):
+        self._env = pass_env()
+        if self._cache is not None:
+            self._cache.load(self._env)
+
+    def decrypt_one(self, entry_name: str, path: str) -> Optional[str]:
+        if self._cache is not None:
+            return self._cache.read_entry(entry_name, path, env=self._env,
+                                          on_error=self.on_error, timeout=self.timeout)
+        return read_gpg(entry_name, path, env=self._env, on_error=self.on_error,
+                        timeout=self.timeout)
+
+    def close(self):
+        if self._cache is not None:
+            self._cache.save(self._env)
+
+
+class BatchGpgBackend(GpgBackend):
+    """Decrypt `batch_size` store files per gpg --decrypt-files process."""
+
+    name = "gpg-batch"
+
+    def __init__(self, batch_size: int = 64):
+        super().__init__()
+        self.batch_size = max(1, batch_size)
+
+    def open(self):
+        super().open()
+        if _shared_memory_dir() is None:
+            print("Warning: there is no /dev/shm, so decrypted entries are written to "
+                  f"{tempfile.gettempdir()} until they are read")
+
+    def decrypt_one(self, entry_name: str, path: str) -> Optional[str]:
+        return self.decrypt_many([(entry_name, path)])[0]
+
+    def decrypt_many(self, entries: List[Tuple[str, str]]) -> List[Optional[str]]:
+        return read_gpg_batch(entries, env=self._env, on_error=self.on_error,
+                              timeout=self.timeout)
+
+
+class PgpBackend(DecryptionBackend):
+    """Decrypt entries in-process with PGPy (see InProcessDecryptor)."""
+
+    name = "pgp"
+
+    def __init__(self, passphrase: Optional[str] = None,
+                 secret_key_file: Optional[str] = None):
+        self._passphrase = passphrase
+        self._secret_key_file = secret_key_file or os.getenv("GPG_SECRET_KEY_FILE", "")
+        self._decryptor: Optional[InProcessDecryptor] = None
+
+    def open(self):
+        self._decryptor = InProcessDecryptor(self._secret_key_file, self._passphrase)
+
+    def decrypt_one(self, entry_name: str, path: str) -> Optional[str]:
+        return self._decryptor.decrypt(entry_name, path, on_error=self.on_error)
+
+    def close(self):
+        if self._decryptor is not None:
+            self._decryptor.close()
+            self._decryptor = None
+
+
+class FakeBackend(DecryptionBackend):
+    """
+    Backend for tests that never touches gpg.
+
+    Returns content from `contents` (keyed by entry name) when given, and
+    otherwise reads each store file as plaintext. Entries listed in `errors`
+    fail as if gpg had printed the given stderr; a list of messages fails
+    once with each of them, after which the entry decrypts normally.
+    `decrypted` records every entry it was asked for, in order.
+    """
+
+    name = "fake"
+
+    def __init__(self, contents: Optional[Dict[str, str]] = None,
+                 errors: Optional[Dict[str, Union[str, List[str]]]] = None,
+                 batch_size: int = 1):
+        self._contents = contents
+        self._errors = {name: list(messages) if isinstance(messages, list) else messages
+                        for name, messages in (errors or {}).items()}
+        self.batch_size = batch_size
+        self.decrypted: List[str] = []
+        self._lock = threading.Lock()
+
+    def _next_error(self, entry_name: str) -> Optional[str]:
+        with self._lock:
+            self.decrypted.append(entry_name)
+            messages = self._errors.get(entry_name)
+            if isinstance(messages, list):
+                return messages.pop(0) if messages else None
+            return messages
+
+    def decrypt_one(self, entry_name: str, path: str) -> Optional[str]:
+        error = self._next_error(entry_name)
+        if error is not None:
+            _report(DecryptionError.from_stderr(entry_name, error), self.on_error)
+            return None
+        if self._contents is not None:
+            return self._contents.get(entry_name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return f.read().strip()
+        except (OSError, UnicodeDecodeError) as e:
+            _report(DecryptionError.from_exception(entry_name, e), self.on_error)
+            return None
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (PassBackend, GpgBackend, BatchGpgBackend, PgpBackend, FakeBackend)
+}
+
+
+def get_backend(name: str, **options) -> DecryptionBackend:
+    """
+    Create the backend registered as `name`.
+
+    Options a backend does not use are ignored, so callers can pass the same
+    options (batch_size, passphrase, ...) whichever backend is selected.
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend: {name}") from None
+
+    accepted = inspect.signature(backend_class).parameters
+    return backend_class(**{k: v for k, v in options.items() if k in accepted})
@@ -0,0 +1,61 @@
+"""Benchmark decryption backends against the same pass store.
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_backends.py [--store PATH] [--limit N] [--repeat N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+
+from migrate import PASS_STORE, list_entry_names, read_entries
+
+# Backends that decrypt with the gpg keyring and need no other setup; pgp needs a
+# secret key file and fake does not decrypt
+BENCHMARKED_BACKENDS = ["pass", "gpg", "gpg-batch"]
+
+
+def bench(pass_store_path: str, backend: str, entry_names, repeat: int) -> float:
+    """Return the best wall time in seconds for reading all entries with `backend`."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # read_entries reports progress per entry; keep it out of the timings table
+        with contextlib.redirect_stdout(io.StringIO()):
+            read_entries(pass_store_path, entry_names, jobs=1, backend=backend)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    """Time each backend sequentially over the same entries."""
+    parser = argparse.ArgumentParser(description="Compare decryption backends.")
+    parser.add_argument("--store", default=os.getenv("PASSWORD_STORE_DIR", PASS_STORE))
+    parser.add_argument("--limit", type=int, default=50, help="entries to decrypt per run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per backend, best is kept")
+    parser.add_argument("--backends", nargs="+", choices=BENCHMARKED_BACKENDS,
+                        default=BENCHMARKED_BACKENDS)
+    args = parser.parse_args()
+
+    pass_store_path = os.path.expanduser(args.store)
+    # The pass backend reads PASSWORD_STORE_DIR, the others the path they are given
+    os.environ["PASSWORD_STORE_DIR"] = pass_store_path
+    entry_names = list_entry_names(pass_store_path)[:args.limit]
+    if not entry_names:
+        print(f"No entries found in {pass_store_path}")
+        return
+
+    print(f"Decrypting {len(entry_names)} entries, best of {args.repeat} runs")
+    baseline = None
+    for backend in args.backends:
+        elapsed = bench(pass_store_path, backend, entry_names, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{backend:>8}: {elapsed:8.3f}s  "
+              f"{1000 * elapsed / len(entry_names):7.2f} ms/entry  "
+              f"{len(entry_names) / elapsed:8.1f} entries/s  "
+              f"x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Benchmark process_pass and process_pass_many against the previous line-by-line parser.
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_parse.py [--entries N] [--repeat N] [--seed N]
+"""
+import argparse
+import functools
+import random
+import time
+from typing import Callable, List, Tuple
+
+from migrate import PassContent, process_pass, process_pass_many
+from parsing import LineClassifier, ParseRule
+
+LINE_TEMPLATES = [
+    "username: {word}",
+    "user: {word}",
+    "Login: {word}",
+    "email: {word}@example.com",
+    "{word}@example.org",
+    "url: https://{word}.example.com/login",
+    "Website: {word}.example.org",
+    "https://{word}.example.net",
+    "otpauth://totp/{word}?secret=JBSWY3DPEHPK3PXP&issuer={word}",
+    "security question: first pet? {word}",
+    "pin: {number}",
+    "{word} {word} {word}",
+    "",
+]
+WORDS = ["alice", "bob", "carol", "dave", "mallory", "trent", "victor", "walter"]
+
+
+def process_pass_baseline(entry_name: str, raw_pass_content: str) -> PassContent:
+    """process_pass as it was before the compiled classifier, for timing comparison."""
+    if not raw_pass_content:
+        return PassContent(name=entry_name, password="")
+
+    password, *rest = raw_pass_content.split('\n')
+    email = username = None
+    notes = []
+    for line in (line.strip() for line in rest):
+        if not line:
+            continue
+        if '@' in line:
+            if ':' in line:
+                email = line.split(':', 1)[1].strip()
+            else:
+                email = line.strip()
+        elif any(line.lower().startswith(prefix) for prefix in ['username:', 'user:', 'login:']):
+            username = line.split(':', 1)[1].strip()
+        else:
+            notes.append(line)
+
+    return PassContent(name=entry_name, password=password.strip(), email=email,
+                       username=username, note=' | '.join(notes) if notes else None)
+
+
+def synthetic_corpus(entries: int, seed: int) -> List[Tuple[str, str]]:
+    """(entry_name, raw content) pairs with 2-8 mixed lines after the password."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(entries):
+        lines = [f"pw-{rng.getrandbits(64):x}"]
+        for template in rng.choices(LINE_TEMPLATES, k=rng.randint(2, 8)):
+            lines.append(template.format(word=rng.choice(WORDS), number=rng.randint(0, 9999)))
+        folder = rng.choice(WORDS + ["websites/example.com", "work/mail.example.org"])
+        corpus.append((f"{folder}/entry-{i}", "\n".join(lines)))
+    return corpus
+
+
+def per_entry(parse: Callable[[str, str], PassContent]) -> Callable[[List[str], List[str]], None]:
+    """Adapt a one-entry parser to parse a whole batch."""
+    def parse_batch(entry_names: List[str], raw_pass_contents: List[str]):
+        for entry_name, raw_pass_content in zip(entry_names, raw_pass_contents):
+            parse(entry_name, raw_pass_content)
+    return parse_batch
+
+
+def bench(parse_batch: Callable[[List[str], List[str]], object],
+          corpus: List[Tuple[str, str]], repeat: int) -> float:
+    """Return the best wall time in seconds for parsing the whole corpus with `parse_batch`."""
+    entry_names = [entry_name for entry_name, _ in corpus]
+    raw_pass_contents = [raw_pass_content for _, raw_pass_content in corpus]
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_batch(entry_names, raw_pass_contents)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    """Time the parsers over the same corpus, after checking the current ones agree."""
+    parser = argparse.ArgumentParser(description="Compare entry parsers.")
+    parser.add_argument("--entries", type=int, default=100_000, help="synthetic entries")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per parser, best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="corpus random seed")
+    parser.add_argument("--prefix-rules", type=int, default=1000,
+                        help="unused line prefixes given to the batch parser with rules")
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.entries, args.seed)
+    # The baseline predates TOTP extraction, so it is timed but not compared
+    columns = process_pass_many(*zip(*corpus))
+    mismatches = [entry_name for (entry_name, raw_pass_content), values
+                  in zip(corpus, zip(*columns.values()))
+                  if process_pass(entry_name, raw_pass_content) != PassContent(*values)]
+    if mismatches:
+        print(f"Parsers disagree on {len(mismatches)} entries, e.g. {mismatches[0]}")
+
+    print(f"Parsing {len(corpus)} entries, best of {args.repeat} runs")
+    baseline = None
+    parsers = [("baseline", per_entry(process_pass_baseline)),
+               ("compiled", per_entry(process_pass)),
+               ("batch", process_pass_many)]
+    if args.prefix_rules:
+        # Prefixes no line uses, so results stay the same and only the regex grows
+        rules = [ParseRule("username", tuple(f"{word}-key-{i}" for word in WORDS))
+                 for i in range(args.prefix_rules // len(WORDS) + 1)]
+        parsers.append(("rules", functools.partial(
+            process_pass_many, classifier=LineClassifier(rules))))
+        print(f"rules: batch parser with {len(WORDS) * len(rules)} extra prefixes")
+    for label, parse_batch in parsers:
+        elapsed = bench(parse_batch, corpus, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{label:>8}: {elapsed:8.3f}s  "
+              f"{1e6 * elapsed / len(corpus):7.2f} us/entry  "
+              f"{len(corpus) / elapsed:10.0f} entries/s  "
+              f"x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Run-time control of how many decryptions are in flight."""
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Set
+
+from backends import DecryptionError
+
+
+class AIMDController:
+    """
+    Adaptive concurrency limit using additive increase, multiplicative decrease.
+
+    Each decryption runs inside slot(), which blocks while `limit` decryptions
+    are already in flight. After each one the caller reports whether it failed
+    (error or timeout). The limit grows by `increase` once a full window of
+    `limit` decryptions has succeeded without congestion, and is multiplied by
+    `decrease` on a failure or when latency exceeds `latency_factor` times the
+    fastest latency seen so far; all three are class attributes to tune. At
+    most one decrease happens per window, so a burst of failures from the same
+    overloaded moment only backs off once.
+    """
+
+    increase = 1
+    decrease = 0.5
+    latency_factor = 3.0
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.history: List[int] = [self.limit]
+
+        self._in_flight = 0
+        # Successes since the last change, fastest latency seen, time of last back-off
+        self._window = {"successes": 0, "min_latency": None, "last_decrease": 0.0}
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one of the `limit` decryption slots for the duration of the block.
+
+        Yields a one-element list; set its item to True if the decryption
+        failed. Latency is measured around the block.
+        """
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+        failed = [False]
+        start = time.monotonic()
+        try:
+            yield failed
+        finally:
+            self._record(start, time.monotonic() - start, failed[0])
+
+    def _record(self, start: float, latency: float, failed: bool):
+        """Update the limit from one finished decryption."""
+        with self._condition:
+            self._in_flight -= 1
+            window = self._window
+            if not failed and (window["min_latency"] is None or latency < window["min_latency"]):
+                window["min_latency"] = latency
+
+            congested = failed or latency > window["min_latency"] * self.latency_factor
+            if congested:
+                # Ignore results from decryptions that started before the last back-off
+                if start >= window["last_decrease"]:
+                    self.limit = max(self.minimum, int(self.limit * self.decrease))
+                    window["last_decrease"] = time.monotonic()
+                    window["successes"] = 0
+                    self.history.append(self.limit)
+            else:
+                window["successes"] += 1
+                if window["successes"] >= self.limit and self.limit < self.maximum:
+                    self.limit = min(self.maximum, self.limit + self.increase)
+                    window["successes"] = 0
+                    self.history.append(self.limit)
+
+            self._condition.notify_all()
+
+    def settled_limit(self) -> int:
+        """Most common limit over the last half of the run's adjustments."""
+        recent = self.history[len(self.history) // 2:]
+        return Counter(recent).most_common(1)[0][0]
+
+    def summary(self) -> str:
+        """One-line report of where the limit settled."""
+        return (f"Adaptive concurrency settled at {self.settled_limit()} "
+                f"(range {min(self.history)}-{max(self.history)}, "
+                f"{len(self.history) - 1} adjustments)")
+
+
+class CircuitOpenError(Exception):
+    """Raised once repeated identical failures show the run cannot make progress."""
+
+    def __init__(self, reason: str, diagnosis: str):
+        super().__init__(diagnosis)
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """
+    Stop a run early when decryptions keep failing for the same reason.
+
+    Failures are reported with record_failure(); after `threshold` consecutive
+    failures sharing one of the TRIP_REASONS, check() raises CircuitOpenError
+    with a diagnosis instead of letting every remaining entry time out. Other
+    reasons (a single corrupt file, say) never trip the breaker, and any
+    success resets the count. Entries passed to expect_failures(), such as
+    those encrypted only to keys that are not here, are ignored when they
+    fail with "no-secret-key".
+    """
+
+    DIAGNOSES = {
+        "timeout": "gpg did not answer in time. gpg-agent is most likely waiting "
+                   "for a passphrase it cannot ask for: check that allow-preset-passphrase "
+                   "is set in gpg-agent.conf and that ENCRYPTION_KEYGRIP is correct.",
+        "no-secret-key": "the entries are encrypted to a key that is not in this keyring. "
+                         "Compare the store's .gpg-id with gpg --list-secret-keys.",
+        "bad-passphrase": "the preset passphrase was rejected. Check GPG_PASSPHRASE.",
+        "pinentry": "gpg tried to prompt for the passphrase and could not. The passphrase "
+                    "preset probably failed; check allow-preset-passphrase and "
+                    "ENCRYPTION_KEYGRIP.",
+        "agent": "gpg could not reach gpg-agent. Start it with gpg-agent --daemon.",
+    }
+    TRIP_REASONS = frozenset(DIAGNOSES)
+
+    def __init__(self, threshold: int = 5):
+        self.threshold = max(1, threshold)
+        self.tripped: Optional[str] = None
+        self._reason: Optional[str] = None
+        self._count = 0
+        self._expected: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def expect_failures(self, entry_names: Iterable[str]):
+        """Mark entries already known to have no secret key to decrypt them."""
+        with self._lock:
+            self._expected.update(entry_names)
+
+    def record_failure(self, error: DecryptionError):
+        """Count a failed decryption."""
+        with self._lock:
+            if error.reason == "no-secret-key" and error.entry_name in self._expected:
+                return
+            if error.reason == self._reason:
+                self._count += 1
+            else:
+                self._reason, self._count = error.reason, 1
+            if self._reason in self.TRIP_REASONS and self._count >= self.threshold:
+                self.tripped = self._reason
+
+    def record_success(self):
+        """Count a successful decryption."""
+        with self._lock:
+            self._reason, self._count = None, 0
+
+    def check(self):
+        """Raise CircuitOpenError if the breaker has tripped."""
+        if self.tripped is not None:
+            raise CircuitOpenError(
+                self.tripped,
+                f"Stopping after {self.threshold} consecutive '{self.tripped}' failures: "
+                f"{self.DIAGNOSES[self.tripped]}"
+            )
+
+    def reset(self):
+        """Close the breaker again, e.g. before retrying the remaining entries."""
+        with self._lock:
+            self.tripped = None
+            self._reason, self._count = None, 0
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How failed decryptions are retried.
+
+    Each attempt may take `timeout` seconds. Failures with a TRANSIENT_REASONS
+    reason (timeouts, gpg-agent contention) are retried up to
+    `max_attempts` attempts in total, waiting an exponentially growing delay
+    with full jitter between attempts. Once `deadline` seconds have passed
+    since start(), nothing is retried any more. Other failures, such as a
+    missing secret key, are permanent and never retried.
+    """
+    TRANSIENT_REASONS = frozenset({"timeout", "agent"})
+
+    max_attempts: int = 3
+    timeout: float = 30
+    base_delay: float = 0.5
+    max_delay: float = 10.0
+    deadline: Optional[float] = None
+    _started: float = field(default_factory=time.monotonic, repr=False)
+
+    def start(self):
+        """Start the run clock that `deadline` is measured against."""
+        self._started = time.monotonic()
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retrying after failed attempt number `attempt`."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def should_retry(self, error: Optional[DecryptionError], attempt: int,
+                     delay: float = 0) -> bool:
+        """Whether to retry after attempt number `attempt` failed with `error`."""
+        if error is None or error.reason not in self.TRANSIENT_REASONS:
+            return False
+        if attempt >= self.max_attempts:
+            return False
+        if self.deadline is not None:
+            return time.monotonic() - self._started + delay < self.deadline
+        return True
+
+
+@dataclass
+class RunControl:
+    """
+    Optional policies applied around each decryption of a run.
+
+    `confirm_retry` is called with the CircuitOpenError and the number of
+    entries left when the breaker trips; returning True retries those entries
+    with the same backend, without walking the store again.
+    """
+    controller: Optional[AIMDController] = None
+    breaker: Optional[CircuitBreaker] = None
+    retry: Optional[RetryPolicy] = None
+    confirm_retry: Optional[Callable[[CircuitOpenError, int], bool]] = None
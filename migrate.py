@@ -1,93 +1,58 @@
 """Migration tool to convert Unix pass entries to Proton Pass CSV format."""
+import argparse
+import asyncio
 import csv
 import os
 import subprocess
 import getpass
-from dataclasses import dataclass, asdict
-from typing import Optional, List, Tuple
+import sys
+import time
+from collections import Counter
+from collections.abc import Sized
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, Iterable, Iterator, Optional, List, Set, Tuple
+
+from backends import (
+    BACKENDS, BackendUnavailableError, DecryptionBackend, DecryptionError, get_backend,
+    pass_env, read_pass, read_pass_async
+)
+from concurrency import (
+    AIMDController, CircuitBreaker, CircuitOpenError, RetryPolicy, RunControl
+)
+from openpgp import WILDCARD_KEY_ID, PacketError, recipient_key_ids, secret_key_ids
+from parsing import LineClassifier, PassContent, process_pass, process_pass_many
+from store import (EntryFilter, ManifestDiff, PassStore, StoreEntry, StoreIndex,
+                   StoreManifest, find_duplicates, git_head, gopass_stores, index_order_key,
+                   mount_stores, scan_parallel)
+from watch import StoreWatcher
+
+__all__ = [
+    "PassContent", "StoreIndex", "process_pass", "process_pass_many", "read_pass", "write_pass",
+    "list_entry_names", "read_entries", "process_all_entries", "process_all_entries_async",
+]
 
 PASS_STORE="~/.password-store"
 OUTPUT_FILE="~/.proton-migrate/protonpass.csv"
+SESSION_KEY_CACHE="~/.proton-migrate/session-keys.gpg"
+MANIFEST_FILE="~/.proton-migrate/manifest.json"
+STORES_DIR="~/.proton-migrate/stores"
+GOPASS_CONFIG="~/.config/gopass/config"
+RULES_FILE="~/.proton-migrate/rules.json"
 
 PROTON_HEADERS = ["name", "url", "email", "username", "password", "note", "totp", "vault"]
 
-@dataclass
-class PassContent:
-    """Data class representing a password entry for Proton Pass import."""
-    name: str
-    password: str
-    url: Optional[str] = None
-    email: Optional[str] = None
-    username: Optional[str] = None
-    note: Optional[str] = None
-    totp: Optional[str] = None
-
-def process_pass(entry_name: str, raw_pass_content: str) -> PassContent:
-    """
-    Parse raw pass content into structured PassContent.
-
-    Expected format:
-    - First line: password
-    - Subsequent lines: key:value pairs or standalone values
-    - email: detected by presence of '@' character
-    - username: detected by 'username:', 'user:', or 'login:' prefix
-    - note: everything else not categorized
-    """
-    if not raw_pass_content:
-        return PassContent(
-            name=entry_name,
-            password=""
-        )
-
-    lines = raw_pass_content.split('\n')
-    password = lines[0].strip() if lines else ""
-
-    email = None
-    username = None
-    note_lines = []
-
-    # Process remaining lines
-    for line in lines[1:]:
-        line = line.strip()
-        if not line:
-            continue
-
-        # Check for email (contains '@')
-        if '@' in line:
-            if ':' in line:
-                # Format: "email: user@example.com"
-                email = line.split(':', 1)[1].strip()
-            else:
-                # Format: "user@example.com"
-                email = line.strip()
-        # Check for username variants
-        elif any(line.lower().startswith(prefix) for prefix in ['username:', 'user:', 'login:']):
-            username = line.split(':', 1)[1].strip()
-        # Everything else goes to notes
-        else:
-            note_lines.append(line)
-
-    # Combine note lines, replacing literal '\n' with ' | ' to avoid CSV issues
-    note = ' | '.join(note_lines) if note_lines else None
-
-    return PassContent(
-        name=entry_name,
-        password=password,
-        email=email,
-        username=username,
-        note=note
-    )
-
-def setup_gpg_agent_passphrase(passphrase: str):
+def setup_gpg_agent_passphrase(passphrase: str, keygrip: Optional[str] = None):
     """
     Preset the passphrase in gpg-agent to avoid interactive prompts.
     This requires gpg-preset-passphrase to be available.
+    The key defaults to the ENCRYPTION_KEYGRIP environment variable.
     """
     if not passphrase:
         return False
 
     try:
-        encryption_keygrip = os.getenv("ENCRYPTION_KEYGRIP", "")
+        encryption_keygrip = keygrip or os.getenv("ENCRYPTION_KEYGRIP", "")
         success = True
         print(f"Setting passphrase for keygrip: {encryption_keygrip}")
 
@@ -140,34 +105,34 @@ def setup_gpg_agent_passphrase(passphrase: str):
         print(f"Failed to setup GPG passphrase: {e}")
         return False
 
-def read_pass(entry_name):
-    """Read a password entry from the pass store."""
-    env = os.environ.copy()
-    env["GPG_TTY"] = subprocess.run(
-        ["tty"], capture_output=True, text=True, check=False
-    ).stdout.strip()
+def secret_keygrips(recipient: str) -> List[str]:
+    """
+    Keygrips of the encryption keys in the secret keyring matching a `.gpg-id` recipient.
 
+    Returns an empty list if there is no such secret key.
+    """
     try:
         result = subprocess.run(
-            ["pass", entry_name],
+            ["gpg", "--batch", "--with-colons", "--with-keygrip", "--list-secret-keys",
+             "--", recipient],
             capture_output=True,
             text=True,
-            env=env,
-            timeout=30,  # Add timeout to prevent hanging
             check=False
         )
-
-        if result.returncode != 0:
-            print(f"Error reading {entry_name}: {result.stderr}")
-            return None
-
-        return result.stdout.strip()
-    except subprocess.TimeoutExpired:
-        print(f"Timeout reading {entry_name}")
-        return None
-    except (subprocess.SubprocessError, OSError) as e:
-        print(f"Exception reading {entry_name}: {e}")
-        return None
+    except OSError:
+        return []
+
+    keygrips = []
+    encrypts = False
+    for line in result.stdout.splitlines():
+        fields = line.split(":")
+        if fields[0] in ("sec", "ssb"):
+            # Lower-case capabilities describe this (sub)key itself
+            encrypts = len(fields) > 11 and "e" in fields[11]
+        elif fields[0] == "grp" and encrypts:
+            keygrips.append(fields[9])
+            encrypts = False
+    return keygrips
 
 def write_pass(output_file: str, rows: List[PassContent]):
     """Write password entries to CSV file for Proton Pass import."""
@@ -183,13 +148,11 @@ def write_pass(output_file: str, rows: List[PassContent]):
         writer = csv.DictWriter(f, fieldnames=PROTON_HEADERS)
         writer.writeheader()
         for r in rows:
-            row_dict = asdict(r)
-            row_dict['vault'] = None  # Add vault field as None
-            writer.writerow(row_dict)
+            writer.writerow(asdict(r))
 
 
-def setup_gpg_passphrase():
-    """Setup GPG passphrase from environment or user input."""
+def setup_gpg_passphrase() -> Optional[str]:
+    """Setup GPG passphrase from environment or user input, and return it."""
     passphrase = os.getenv("GPG_PASSPHRASE")
     if not passphrase:
         passphrase = getpass.getpass("Enter GPG passphrase: ")
@@ -201,66 +164,807 @@ def setup_gpg_passphrase():
         else:
             print("GPG passphrase setup failed, you may need to enter it manually")
 
+    return passphrase
+
+
+def confirm_retry(_error: CircuitOpenError, remaining: int) -> bool:
+    """Ask whether to retry the remaining entries after the circuit breaker tripped."""
+    if not sys.stdin.isatty():
+        print(f"Aborting with {remaining} entries left unread")
+        return False
+
+    answer = input(
+        f"Fix the problem and press Enter to retry the {remaining} remaining entries, "
+        "'p' to re-enter the GPG passphrase first, or 'q' to stop: "
+    ).strip().lower()
+    if answer == "q":
+        return False
+    if answer == "p":
+        setup_gpg_agent_passphrase(getpass.getpass("Enter GPG passphrase: "))
+    return True
+
 
 def count_gpg_files(pass_store_path: str) -> int:
     """Count total GPG files in the pass store."""
-    total_files = 0
-    for _, _, files in os.walk(pass_store_path):
-        for file in files:
-            if file.endswith(".gpg"):
-                total_files += 1
-    return total_files
+    return len(StoreIndex.scan(pass_store_path))
+
+
+def list_entry_names(pass_store_path: str) -> List[str]:
+    """List pass entry names (store-relative, without .gpg) in index order."""
+    return StoreIndex.scan(pass_store_path).names()
+
+
+class _ChunkReader:
+    """
+    Decrypts the chunks of one read_entries run, applying its RunControl.
+
+    Chunks are numbered in the order they are handed to run(), and contents
+    are stored in `results` by chunk index as chunks finish, so a run
+    interrupted by the circuit breaker keeps what it has already read.
+    """
+
+    def __init__(self, pass_store_path: str, decryption_backend: DecryptionBackend,
+                 control: RunControl):
+        self.pass_store_path = pass_store_path
+        self.chunks: List[List[str]] = []
+        self.backend = decryption_backend
+        self.control = control
+        self.results: Dict[int, List[Optional[str]]] = {}
+        self.last_errors: Dict[str, DecryptionError] = {}
+
+        decryption_backend.on_error = self.on_error
+        if control.retry:
+            decryption_backend.timeout = control.retry.timeout
+            control.retry.start()
+
+    def on_error(self, error: DecryptionError):
+        """Report a failed entry and feed it to the circuit breaker."""
+        print(error)
+        self.last_errors[error.entry_name] = error
+        if self.control.breaker:
+            self.control.breaker.record_failure(error)
+
+    def decrypt(self, entries: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """Decrypt entries with the backend, within the adaptive limit if there is one."""
+        controller = self.control.controller
+        if not controller:
+            return self.backend.decrypt_many(entries)
+        with controller.slot() as failed:
+            contents = self.backend.decrypt_many(entries)
+            failed[0] = any(content is None for content in contents)
+        return contents
+
+    def retry_failed(self, entries: List[Tuple[str, str]], contents: List[Optional[str]]):
+        """
+        Retry the transiently failed entries of one chunk in place, as the policy allows.
+
+        Raises CircuitOpenError instead of starting another round once the
+        circuit breaker has tripped.
+        """
+        policy = self.control.retry
+        breaker = self.control.breaker
+        attempt = 1
+        while True:
+            if breaker:
+                breaker.check()
+            delay = policy.delay(attempt)
+            retry = [index for index, (entry_name, _) in enumerate(entries)
+                     if contents[index] is None
+                     and policy.should_retry(self.last_errors.get(entry_name), attempt, delay)]
+            if not retry:
+                return
+
+            print(f"  Retrying {len(retry)} entries in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{policy.max_attempts})")
+            time.sleep(delay)
+            attempt += 1
+            for index, content in zip(retry, self.decrypt([entries[i] for i in retry])):
+                contents[index] = content
+
+    def read_chunk(self, index: int):
+        """Decrypt one chunk and store its contents in `results`."""
+        breaker = self.control.breaker
+        if breaker:
+            breaker.check()
+        for entry_name in self.chunks[index]:
+            print(f"Processing: {entry_name}")
+        entries = [(name, os.path.join(self.pass_store_path, name + ".gpg"))
+                   for name in self.chunks[index]]
+        contents = self.decrypt(entries)
+        # Stored before retrying, so a trip during the retries keeps what was read
+        self.results[index] = contents
+        if self.control.retry:
+            self.retry_failed(entries, contents)
+        if breaker and any(content is not None for content in contents):
+            breaker.record_success()
+
+    def run(self, chunks: Iterable[List[str]], workers: int):
+        """
+        Read every chunk on a thread pool of `workers` threads.
+
+        Each chunk starts decrypting as soon as `chunks` yields it, so a lazy
+        source such as a store scan overlaps with decryption. If the circuit
+        breaker trips, unread and failed chunks are retried for as long as
+        control.confirm_retry agrees.
+        """
+        pending: Optional[List[int]] = None
+        while pending is None or pending:
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = []
+                    if pending is None:
+                        for chunk in chunks:
+                            self.chunks.append(chunk)
+                            futures.append(executor.submit(self.read_chunk, len(self.chunks) - 1))
+                    else:
+                        futures = [executor.submit(self.read_chunk, i) for i in pending]
+                    pending = []
+                    for future in futures:
+                        future.result()
+            except CircuitOpenError as e:
+                print(f"\n{e}")
+                # Retry unread chunks and failed ones, which likely failed for the same reason
+                pending = [index for index in range(len(self.chunks))
+                           if None in self.results.get(index, [None])]
+                remaining = sum(len(self.chunks[index]) for index in pending)
+                if self.control.confirm_retry and self.control.confirm_retry(e, remaining):
+                    self.control.breaker.reset()
+                    continue
+            break
+
+    def contents(self) -> List[Optional[str]]:
+        """All contents in chunk order, None for entries that were never read."""
+        return [content for index, chunk in enumerate(self.chunks)
+                for content in self.results.get(index, [None] * len(chunk))]
+
+
+def _chunked(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    """Group items into lists of `size`, without consuming more than needed."""
+    chunk: List[str] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_entries(pass_store_path: str, entry_names: Iterable[str], jobs: int = 1,
+                 backend: str = "pass", control: Optional[RunControl] = None,
+                 **backend_options) -> List[Optional[str]]:
+    """
+    Read many entries, returning their contents (or None) in `entry_names` order.
+
+    `backend` names one of backends.BACKENDS and is created with
+    `backend_options`. Entries are handed to it in chunks of its batch_size,
+    with up to `jobs` chunks decrypting concurrently; `entry_names` may be a
+    lazy iterable, in which case decryption starts before it is exhausted.
+    `control` can replace the fixed limit with an adaptive controller, retry
+    transient failures and add a circuit breaker (see concurrency.RunControl).
+    """
+    control = control or RunControl()
+
+    with get_backend(backend, **backend_options) as decryption_backend:
+        reader = _ChunkReader(pass_store_path, decryption_backend, control)
+        reader.run(_chunked(entry_names, decryption_backend.batch_size),
+                   control.controller.maximum if control.controller else max(1, jobs))
+
+    if control.controller:
+        print(control.controller.summary())
+    # Contents are kept by chunk index, so the CSV stays in store order
+    return reader.contents()
 
 
-def process_all_entries(pass_store_path: str) -> Tuple[List[PassContent], int, int]:
-    """Process all password entries and return results."""
+def _parse_entries(read_results: Iterable[Tuple[str, Optional[str]]],
+                   classifier: Optional[LineClassifier] = None) -> List[PassContent]:
+    """Parse (entry_name, raw content) pairs, reporting entries that could not be read."""
     processed_pass_rows: List[PassContent] = []
-    processed_files = 0
-    total_files = count_gpg_files(pass_store_path)
+    for entry_name, raw_pass_content in read_results:
+        if raw_pass_content:
+            processed_pass_rows.append(process_pass(entry_name, raw_pass_content, classifier))
+        else:
+            print(f"  Failed to read: {entry_name}")
+    return processed_pass_rows
 
-    print(f"Found {total_files} password entries to process")
 
-    for root, _, files in os.walk(pass_store_path):
-        for file in files:
-            if not file.endswith(".gpg"):
-                continue
+def _read_deduplicated(pass_store_path: str, entries: Iterable[StoreEntry],
+                       **read_options) -> List[Tuple[str, Optional[str]]]:
+    """
+    Decrypt `entries` with read_entries(**read_options), duplicates only once.
 
-            path = os.path.join(root, file)
-            entry_name = os.path.relpath(path, pass_store_path)[:-4]
+    Returns (entry_name, raw content) pairs for every entry, in no particular order.
+    """
+    duplicates: Dict[str, List[str]] = {}
+    if not isinstance(entries, Sized):
+        print("Scanning the store and processing entries as they are found...")
+    else:
+        print(f"Found {len(entries)} password entries to process")
+        duplicates = find_duplicates(entries)
+        if duplicates:
+            print(f"{sum(map(len, duplicates.values()))} entries are hard links, symlinks "
+                  f"or copies of others and are decrypted only once")
+    skipped = {name for names in duplicates.values() for name in names}
+
+    entry_names: List[str] = []
+
+    def discovered_names():
+        for entry in entries:
+            if entry.name not in skipped:
+                entry_names.append(entry.name)
+                yield entry.name
+
+    raw_contents = read_entries(pass_store_path, discovered_names(), **read_options)
+    read_results = list(zip(entry_names, raw_contents))
+    read_results += [(duplicate, content) for entry_name, content in read_results
+                     for duplicate in duplicates.get(entry_name, ())]
+    return read_results
+
+
+def process_all_entries(  # pylint: disable=too-many-arguments
+        pass_store_path: str, jobs: int = 1, backend: str = "pass",
+        control: Optional[RunControl] = None,
+        entries: Optional[Iterable[StoreEntry]] = None, *,
+        classifier: Optional[LineClassifier] = None,
+        **backend_options) -> Tuple[List[PassContent], int, int]:
+    """
+    Process all password entries and return results.
+
+    Entries come from `entries`, or from a fresh StoreIndex scan when it is
+    not given, and are decrypted in the order given. `entries` may also be a
+    lazy source such as store.scan_parallel(), in which case decryption
+    starts while the store is still being scanned. Otherwise, duplicate
+    entries (see store.find_duplicates) are decrypted once and their rows
+    copied to every name. Entries are decrypted by up to `jobs` concurrent
+    reads using `backend`, `control` and `backend_options` (see read_entries)
+    and parsed with `classifier` (see parsing.LineClassifier); the returned
+    rows are in index order either way.
+    """
+    if entries is None:
+        entries = StoreIndex.scan(pass_store_path)
 
+    read_results = _read_deduplicated(pass_store_path, entries, jobs=jobs, backend=backend,
+                                      control=control, **backend_options)
+    total_files = len(read_results)
+    if not isinstance(entries, Sized):
+        print(f"Found {total_files} password entries")
+
+    read_results.sort(key=lambda result: index_order_key(result[0]))
+    processed_pass_rows = _parse_entries(read_results, classifier)
+    return processed_pass_rows, len(processed_pass_rows), total_files
+
+
+async def process_all_entries_async(
+        pass_store_path: str, concurrency: int = 64, timeout: float = 30,
+        classifier: Optional[LineClassifier] = None
+) -> Tuple[List[PassContent], int, int]:
+    """
+    Asyncio counterpart of process_all_entries.
+
+    At most `concurrency` pass processes are in flight at once, each bounded by
+    `timeout` seconds. Rows are parsed with `classifier` and returned in store
+    order.
+    """
+    # Walking the store and the GPG_TTY lookup block, so run them off the event loop
+    loop = asyncio.get_running_loop()
+    store_index = await loop.run_in_executor(None, StoreIndex.scan, pass_store_path)
+    total_files = len(store_index)
+
+    print(f"Found {total_files} password entries to process")
+
+    entry_names = store_index.names()
+    # Once for the whole run rather than per entry
+    env = await loop.run_in_executor(None, pass_env)
+    semaphore = asyncio.BoundedSemaphore(max(1, concurrency))
+
+    async def read_entry(entry_name):
+        async with semaphore:
             print(f"Processing: {entry_name}")
-            raw_pass_content = read_pass(entry_name)
+            return await read_pass_async(entry_name, env=env, timeout=timeout)
+
+    raw_contents = await asyncio.gather(*(read_entry(name) for name in entry_names))
 
-            if raw_pass_content:
-                processed_pass_content = process_pass(entry_name, raw_pass_content)
-                processed_pass_rows.append(processed_pass_content)
-                processed_files += 1
-            else:
-                print(f"  Failed to read: {entry_name}")
+    processed_pass_rows = _parse_entries(zip(entry_names, raw_contents), classifier)
+    return processed_pass_rows, len(processed_pass_rows), total_files
 
-    return processed_pass_rows, processed_files, total_files
 
+def schedule_by_recipient(store_index: StoreIndex, passphrase: Optional[str] = None,
+                          breaker: Optional[CircuitBreaker] = None) -> List[StoreEntry]:
+    """
+    Order the index's entries one `.gpg-id` recipient group at a time.
+
+    gpg-agent then works with one unlocked key at a time instead of
+    alternating between keys. With a `passphrase`, it is preset once for
+    every secret encryption key the groups need (other than
+    ENCRYPTION_KEYGRIP, which setup_gpg_passphrase() already preset).
+    Groups none of whose recipients has a secret key here are scheduled
+    last, and `breaker` is told to expect their failures, so they can
+    neither trip it nor stop the entries that can be decrypted.
+    """
+    groups = store_index.recipient_groups()
+    if len(groups) > 1:
+        print(f"Entries are encrypted to {len(groups)} different sets of keys:")
+        for recipients, group in groups.items():
+            print(f"  {', '.join(recipients) or '(no .gpg-id)'}: {len(group)} entries")
+
+    preset = {os.getenv("ENCRYPTION_KEYGRIP", "")}
+    keyless = set()
+    for recipient in dict.fromkeys(r for recipients in groups for r in recipients):
+        keygrips = secret_keygrips(recipient)
+        if not keygrips:
+            print(f"No secret key for recipient {recipient}, its entries will fail")
+            keyless.add(recipient)
+        for keygrip in keygrips:
+            if passphrase and keygrip not in preset:
+                setup_gpg_agent_passphrase(passphrase, keygrip)
+                preset.add(keygrip)
+
+    # Entries without a .gpg-id have no known recipients and are tried normally
+    doomed = [entry for recipients, group in groups.items()
+              if recipients and keyless.issuperset(recipients) for entry in group]
+    if doomed and breaker:
+        breaker.expect_failures(entry.name for entry in doomed)
+    return [entry for recipients, group in groups.items()
+            if not (recipients and keyless.issuperset(recipients)) for entry in group] + doomed
+
+def preflight_check(entries: Iterable[StoreEntry]) -> List[StoreEntry]:
+    """
+    Drop entries that no key in the secret keyring can decrypt.
 
-def main():
+    Reads each entry's recipient key IDs from its OpenPGP packets instead of
+    running gpg on it, and prints how many entries each key can open.
+    Entries that cannot be inspected, are symmetrically encrypted or have a
+    hidden recipient are kept, for the backend to try. Consumes `entries`,
+    so a streamed scan is finished before anything is decrypted.
+    """
+    available = secret_key_ids()
+    distribution: Counter = Counter()
+    decryptable: List[StoreEntry] = []
+    skipped: List[str] = []
+    for entry in entries:
+        try:
+            key_ids = recipient_key_ids(entry.path)
+        except (OSError, PacketError) as e:
+            print(f"  Could not inspect {entry.name}: {e}")
+            decryptable.append(entry)
+            continue
+        distribution.update(key_ids)
+        if (not key_ids or WILDCARD_KEY_ID in key_ids
+                or not available.isdisjoint(key_ids)):
+            decryptable.append(entry)
+        else:
+            skipped.append(entry.name)
+
+    print("Entries per recipient key:")
+    for key_id, count in distribution.most_common():
+        if key_id == WILDCARD_KEY_ID:
+            status = "hidden recipient"
+        else:
+            status = "secret key available" if key_id in available else "no secret key"
+        print(f"  {key_id}: {count} entries ({status})")
+    if skipped:
+        print(f"Skipping {len(skipped)} entries encrypted only to keys with no secret key here:")
+        for entry_name in skipped:
+            print(f"  {entry_name}")
+    return decryptable
+
+def discover_entries(pass_store_path: str, use_git: bool = False, scan_workers: int = 0,
+                     entry_filter: Optional[EntryFilter] = None
+                     ) -> Optional[Iterable[StoreEntry]]:
+    """
+    Find the store's entries for process_all_entries().
+
+    With `use_git`, entries come from `git ls-files` when the store is a git
+    repository. With `scan_workers`, directories are listed in parallel and
+    entries streamed as they are found. Only entries `entry_filter` covers
+    are returned, and excluded directories are not walked. Returns None to
+    let process_all_entries() walk the whole store itself.
+    """
+    if use_git:
+        store_index = StoreIndex.from_git(pass_store_path, entry_filter)
+        if store_index is not None:
+            return store_index
+        print(f"{pass_store_path} is not a git repository, walking the store instead")
+    if scan_workers > 0:
+        return scan_parallel(pass_store_path, workers=scan_workers, entry_filter=entry_filter)
+    if entry_filter:
+        return StoreIndex.scan(pass_store_path, entry_filter)
+    return None
+
+def _complete_index(pass_store_path: str, entries: Optional[Iterable[StoreEntry]],
+                    entry_filter: Optional[EntryFilter] = None) -> StoreIndex:
+    """Collect discovered entries, or walk the store if there are none, into an index."""
+    if isinstance(entries, StoreIndex):
+        return entries
+    if entries is not None:
+        return StoreIndex.from_entries(pass_store_path, entries, entry_filter)
+    return StoreIndex.scan(pass_store_path, entry_filter)
+
+@dataclass
+class _ManifestRun:
+    """A run checked against the StoreManifest at `path`, and recorded in it afterwards."""
+    path: str
+    manifest: StoreManifest
+    store_index: StoreIndex
+    diff: ManifestDiff
+    head: Optional[str] = None
+
+    @classmethod
+    def start(cls, path: str, store_index: StoreIndex,
+              head: Optional[str] = None) -> "_ManifestRun":
+        """Load the manifest and report what changed, using git if `head` is known."""
+        manifest = StoreManifest.load(path)
+        diff = manifest.classify_git(store_index) if head else None
+        if diff is None:
+            diff = manifest.classify(store_index)
+        print(f"Changes since the last run: {diff.summary()}")
+        return cls(path, manifest, store_index, diff, head)
+
+    def pending(self, incremental: bool) -> StoreIndex:
+        """The entries to decrypt: all of them, or only added and changed ones."""
+        if not incremental:
+            return self.store_index
+        changed = set(self.diff.added) | set(self.diff.changed)
+        return StoreIndex(self.store_index.pass_store_path,
+                          [entry for entry in self.store_index if entry.name in changed],
+                          self.store_index.entry_filter)
+
+    def finish(self, rows: List[PassContent], incremental: bool):
+        """Record the exported entries and save the manifest."""
+        exported = {row.name for row in rows}
+        # Skipped entries were exported by an earlier run, as it recorded them
+        unchanged = self.diff.unchanged if incremental else []
+        self.manifest.record(self.store_index,
+                             [name for name in self.store_index.names() if name in exported],
+                             unchanged)
+        if self.head:
+            self.manifest.commit = self.head
+            print(f"Exported commit: {self.head}")
+        self.manifest.save(self.path)
+        print(f"Manifest written to: {self.path}")
+
+def watch_and_export(pass_store_path: str, rows: List[PassContent],
+                     entry_filter: Optional[EntryFilter] = None,
+                     mounts: Optional[Dict[str, PassStore]] = None,
+                     classifier: Optional[LineClassifier] = None, **read_options):
+    """
+    Keep OUTPUT_FILE in sync with the store until interrupted.
+
+    Starts from the exported `rows`; on every change only the affected
+    entries are decrypted again (using `read_options`, see read_entries)
+    and parsed with `classifier`, and the CSV is rewritten (see
+    assign_vaults for `mounts`). An entry that fails to decrypt keeps its
+    previous row.
+    """
+    exported = {row.name: row for row in rows}
+
+    def on_change(changed: Set[str], deleted: Set[str]):
+        for entry_name in deleted:
+            exported.pop(entry_name, None)
+        entry_names = sorted(changed, key=index_order_key)
+        raw_contents = read_entries(pass_store_path, entry_names, **read_options)
+        for row in _parse_entries(zip(entry_names, raw_contents), classifier):
+            exported[row.name] = row
+        write_pass(OUTPUT_FILE, assign_vaults(
+            sorted(exported.values(), key=lambda row: index_order_key(row.name)), mounts))
+        print(f"CSV file rewritten: {len(exported)} entries "
+              f"({len(changed)} changed, {len(deleted)} deleted)")
+
+    try:
+        watcher = StoreWatcher(pass_store_path, exported, entry_filter)
+    except OSError as e:
+        print(f"Cannot watch the store: {e}")
+        return
+    print(f"Watching {pass_store_path} for changes, press Ctrl-C to stop")
+    try:
+        watcher.run(on_change)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.close()
+
+def resolve_stores(args: argparse.Namespace) -> Tuple[str, Dict[str, PassStore]]:
+    """
+    Decide which stores the run covers, from --gopass, --store and --vault.
+
+    Returns the store path to index and the stores mounted in it, and
+    exits if the gopass config cannot be read or has no stores. A single
+    store is indexed directly and mounted at "". Several stores are
+    symlinked side by side into STORES_DIR (see store.mount_stores), so
+    discovery and decryption cover all of them in one pass.
+    """
+    if args.gopass:
+        try:
+            stores = gopass_stores(args.gopass)
+        except OSError as e:
+            sys.exit(f"Cannot read the gopass config: {e}")
+    else:
+        main_store = os.getenv("PASSWORD_STORE_DIR") or PASS_STORE
+        stores = [PassStore(os.path.expanduser(main_store), args.vault)]
+    for store_arg in args.store:
+        path, _, vault = store_arg.partition("=")
+        stores.append(PassStore(os.path.expanduser(path), vault or None))
+    if not stores:
+        sys.exit(f"No stores found in the gopass config {args.gopass}")
+
+    if len(stores) == 1:
+        return stores[0].path, {"": stores[0]}
+    mounts = mount_stores(stores, STORES_DIR)
+    print("Migrating stores:")
+    for mount, store in mounts.items():
+        print(f"  {store.path} -> vault {store.vault} (entries listed as {mount}/...)")
+    return os.path.expanduser(STORES_DIR), mounts
+
+def assign_vaults(rows: List[PassContent],
+                  mounts: Optional[Dict[str, PassStore]] = None) -> List[PassContent]:
+    """
+    Rows as they go into the CSV, each in the vault of the store it came from.
+
+    Entry names of a combined run start with their store's mount, which is
+    replaced by the vault. A store mounted at "" is the only store of the run.
+    """
+    if not mounts:
+        return rows
+    if "" in mounts:
+        return [replace(row, vault=mounts[""].vault) for row in rows]
+    vault_rows = []
+    for row in rows:
+        mount, _, entry_name = row.name.partition("/")
+        vault_rows.append(replace(row, name=entry_name, vault=mounts[mount].vault))
+    return vault_rows
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(
+        description="Convert Unix pass entries to Proton Pass CSV format."
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="number of entries to decrypt concurrently (default: 1)"
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="adjust the number of concurrent decryptions during the run from "
+             "latency and failures, starting at --jobs"
+    )
+    parser.add_argument(
+        "--max-jobs",
+        type=int,
+        default=32,
+        help="upper bound on concurrent decryptions with --adaptive (default: 32)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30,
+        help="seconds each decryption may take (default: 30)"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="times to retry an entry after a timeout or gpg-agent error, with "
+             "exponential backoff (default: 2)"
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="stop retrying failed entries once the run has taken this long"
+    )
+    parser.add_argument(
+        "--breaker-threshold",
+        type=int,
+        default=5,
+        help="stop after this many consecutive decryptions fail for the same reason "
+             "(timeouts, missing secret key, pinentry or agent errors); 0 disables "
+             "(default: 5)"
+    )
+    parser.add_argument(
+        "--scan-workers",
+        type=int,
+        default=0,
+        help="list this many store directories at once and start decrypting entries "
+             "before the scan has finished; useful for large stores on network "
+             "filesystems (default: 0, scan first)"
+    )
+    parser.add_argument(
+        "--manifest",
+        nargs="?",
+        const=MANIFEST_FILE,
+        metavar="PATH",
+        help="compare the store with the manifest of the previous run before "
+             "decrypting, and write a new one afterwards "
+             f"(default path: {MANIFEST_FILE})"
+    )
+    parser.add_argument(
+        "--store",
+        action="append",
+        default=[],
+        metavar="PATH[=VAULT]",
+        help="also migrate the store at PATH, into VAULT (default: the store's directory "
+             "name); may be repeated"
+    )
+    parser.add_argument(
+        "--gopass",
+        nargs="?",
+        const=GOPASS_CONFIG,
+        metavar="CONFIG",
+        help="migrate every store mounted in gopass instead of the pass store, each into "
+             f"a vault named after its mount (default config: {GOPASS_CONFIG})"
+    )
+    parser.add_argument(
+        "--vault",
+        help="vault for the pass store's entries (default: none, or the store's directory "
+             "name when migrating several stores)"
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="only migrate entries matching this glob (e.g. 'work/**'), or regex when "
+             "prefixed with 're:'; may be repeated"
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="skip entries matching this glob (e.g. 'archive/**') or 're:' regex; "
+             "may be repeated"
+    )
+    parser.add_argument(
+        "--git",
+        action="store_true",
+        help="list entries with git ls-files instead of walking the store; with "
+             "--manifest, find changes with git diff since the last exported commit"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only decrypt and export entries added or changed since the manifest "
+             "was written (implies --manifest)"
+    )
+    parser.add_argument(
+        "--preflight",
+        action="store_true",
+        help="read each entry's recipient key IDs before decrypting, report how many "
+             "entries each key opens, and skip entries no secret key here can decrypt"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="after the export, keep running and update the CSV whenever entries "
+             "change (Linux only)"
+    )
+    parser.add_argument(
+        "--rules",
+        nargs="?",
+        const=RULES_FILE,
+        metavar="PATH",
+        help="extra parsing rules, a JSON file mapping line prefixes and patterns to "
+             f"CSV columns (default path: {RULES_FILE})"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(name for name in BACKENDS if name != "fake"),
+        default="pass",
+        help="decrypt with the pass CLI, by running gpg directly, by sending "
+             "batches of files through one gpg process, or in-process with PGPy "
+             "(default: pass)"
+    )
+    parser.add_argument(
+        "--session-key-cache",
+        nargs="?",
+        const=SESSION_KEY_CACHE,
+        metavar="PATH",
+        help="with --backend gpg only, reuse session keys of unchanged entries from an "
+             f"encrypted cache (default path: {SESSION_KEY_CACHE})"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="entries per gpg process with --backend gpg-batch (default: 64)"
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.watch and args.incremental:
+        parser.error("--watch keeps the whole export in sync and cannot be combined "
+                     "with --incremental")
+    if args.session_key_cache and args.backend != "gpg":
+        parser.error("--session-key-cache only works with --backend gpg")
+    if args.backend == "pgp" and not os.path.isfile(
+            os.path.expanduser(os.getenv("GPG_SECRET_KEY_FILE", ""))):
+        parser.error("--backend pgp needs GPG_SECRET_KEY_FILE set to an ASCII-armored "
+                     "export of your secret key")
+    if args.incremental and not args.manifest:
+        args.manifest = MANIFEST_FILE
+    # Compiled once here, so a broken rules file fails before anything is decrypted
+    args.classifier = None
+    if args.rules:
+        try:
+            args.classifier = LineClassifier.load(args.rules)
+        except (OSError, ValueError) as e:
+            parser.error(f"--rules: {e}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
     """Main function to process all pass entries and create CSV export."""
-    setup_gpg_passphrase()
+    args = parse_args(argv)
+    passphrase = setup_gpg_passphrase()
 
-    pass_store_path = os.path.expanduser(PASS_STORE)
+    pass_store_path, mounts = resolve_stores(args)
+    # So the pass backend reads the same store that is indexed
+    os.environ["PASSWORD_STORE_DIR"] = pass_store_path
 
     print("\n" + "="*50)
     print("Processing all entries...")
     print("="*50)
 
-    processed_pass_rows, processed_files, total_files = process_all_entries(pass_store_path)
+    control = RunControl(
+        confirm_retry=confirm_retry,
+        retry=RetryPolicy(max_attempts=args.retries + 1, timeout=args.timeout,
+                          deadline=args.deadline)
+    )
+    if args.adaptive:
+        control.controller = AIMDController(initial=args.jobs, maximum=args.max_jobs)
+    if args.breaker_threshold > 0:
+        control.breaker = CircuitBreaker(threshold=args.breaker_threshold)
+
+    # Taken before discovery so changes committed during the run are exported next time
+    head = git_head(pass_store_path) if args.git else None
+    entry_filter = EntryFilter(args.include, args.exclude)
+    entries = discover_entries(pass_store_path, args.git, args.scan_workers, entry_filter)
+
+    manifest_run = None
+    if args.manifest:
+        # Classifying needs the complete index before anything is decrypted
+        manifest_run = _ManifestRun.start(
+            args.manifest, _complete_index(pass_store_path, entries, entry_filter), head)
+        entries = manifest_run.pending(args.incremental)
+
+    # Entries streamed from a parallel scan are decrypted in the order they are found
+    if entries is None or isinstance(entries, StoreIndex):
+        entries = schedule_by_recipient(
+            _complete_index(pass_store_path, entries, entry_filter), passphrase,
+            control.breaker)
+    if args.preflight:
+        entries = preflight_check(entries)
+
+    read_options = {
+        "jobs": args.jobs, "backend": args.backend, "control": control,
+        "batch_size": args.batch_size, "passphrase": passphrase,
+        "session_key_cache": args.session_key_cache,
+    }
+    try:
+        processed_pass_rows, processed_files, total_files = process_all_entries(
+            pass_store_path, entries=entries, classifier=args.classifier, **read_options
+        )
+    except BackendUnavailableError as e:
+        sys.exit(f"Cannot decrypt with --backend {args.backend}: {e}")
 
     print(f"\nSuccessfully processed {processed_files}/{total_files} entries")
 
     if processed_pass_rows:
-        write_pass(OUTPUT_FILE, processed_pass_rows)
+        write_pass(OUTPUT_FILE, assign_vaults(processed_pass_rows, mounts))
         print(f"CSV file written to: {OUTPUT_FILE}")
         print(f"Total entries in CSV: {len(processed_pass_rows)}")
     else:
         print("No entries were processed successfully")
 
+    if manifest_run is not None:
+        manifest_run.finish(processed_pass_rows, args.incremental)
+
+    if args.watch:
+        watch_and_export(pass_store_path, processed_pass_rows, entry_filter, mounts,
+                         args.classifier, **read_options)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,129 @@
+"""Minimal OpenPGP packet reading, enough to tell who an entry is encrypted to."""
+import mmap
+import subprocess
+from typing import Iterator, Optional, Set, Tuple
+
+PKESK_TAG = 1
+SKESK_TAG = 3
+MARKER_TAG = 10
+
+# Key ID of a PKESK packet whose recipient is hidden (gpg --throw-keyids)
+WILDCARD_KEY_ID = "0000000000000000"
+
+
+class PacketError(Exception):
+    """Raised when a file does not start with well-formed OpenPGP packets."""
+
+
+def _packet_tag(data, offset: int) -> int:
+    """Tag of the packet starting at `offset`."""
+    if offset >= len(data) or not data[offset] & 0x80:
+        raise PacketError(f"no packet header at byte {offset}")
+    header = data[offset]
+    # New format: tag in the low six bits; old format: tag in bits 2-5
+    return header & 0x3F if header & 0x40 else (header >> 2) & 0x0F
+
+
+def _packet_header(data, offset: int) -> Tuple[int, int, int]:
+    """Parse the packet header at `offset`: (tag, body offset, body length)."""
+    tag = _packet_tag(data, offset)
+    header = data[offset]
+
+    if header & 0x40:
+        # New format: variable-length length
+        first = data[offset + 1]
+        if first < 192:
+            return tag, offset + 2, first
+        if first < 224:
+            return tag, offset + 3, ((first - 192) << 8) + data[offset + 2] + 192
+        if first == 255:
+            return tag, offset + 6, int.from_bytes(data[offset + 2:offset + 6], "big")
+        raise PacketError(f"partial body length in packet at byte {offset}")
+
+    # Old format: length size in bits 0-1
+    length_type = header & 0x03
+    if length_type == 3:
+        raise PacketError(f"indeterminate length in packet at byte {offset}")
+    size = 1 << length_type
+    return tag, offset + 1 + size, int.from_bytes(data[offset + 1:offset + 1 + size], "big")
+
+
+def _pkesk_key_id(body) -> str:
+    """Recipient key ID (or fingerprint, for v6 packets) of a PKESK packet body."""
+    version = body[0]
+    if version == 3:
+        return body[1:9].hex().upper()
+    if version == 6:
+        # Length of key version + fingerprint, 0 for an anonymous recipient
+        length = body[1]
+        return body[3:2 + length].hex().upper() if length else WILDCARD_KEY_ID
+    raise PacketError(f"unsupported PKESK version {version}")
+
+
+def _session_key_packets(data) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (tag, body) for the session key packets at the start of a message.
+
+    Reading stops at the first other packet before its length is decoded:
+    the encrypted data packet that follows usually has a partial body
+    length, which only session key packets are guaranteed not to use.
+    """
+    offset = 0
+    while offset < len(data):
+        if _packet_tag(data, offset) not in (PKESK_TAG, SKESK_TAG, MARKER_TAG):
+            return
+        tag, body_offset, length = _packet_header(data, offset)
+        if body_offset + length > len(data):
+            raise PacketError(f"packet at byte {offset} runs past the end of the file")
+        yield tag, data[body_offset:body_offset + length]
+        offset = body_offset + length
+
+
+def recipient_key_ids(path: str) -> Tuple[str, ...]:
+    """
+    Key IDs an encrypted file's session key is encrypted to, without decrypting it.
+
+    Only the public-key encrypted session key packets at the start of the
+    file are read, from a memory map, so the rest of the file is never
+    paged in. Key IDs are upper-case hex; WILDCARD_KEY_ID stands for a
+    hidden recipient. Raises PacketError if the file is not a binary
+    OpenPGP message and OSError if it cannot be read.
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            # Empty files cannot be mapped
+            raise PacketError(f"cannot map {path}: {e}") from e
+
+    try:
+        return tuple(_pkesk_key_id(body) for tag, body in _session_key_packets(data)
+                     if tag == PKESK_TAG)
+    except IndexError as e:
+        raise PacketError(f"truncated packet in {path}") from e
+    finally:
+        data.close()
+
+
+def secret_key_ids(env: Optional[dict] = None) -> Set[str]:
+    """
+    Key IDs and fingerprints of every key and subkey in the secret keyring.
+
+    Fingerprints are included so v6 PKESK packets, which name the recipient
+    by fingerprint, can be matched too.
+    """
+    result = subprocess.run(
+        ["gpg", "--batch", "--with-colons", "--list-secret-keys"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False
+    )
+    key_ids = set()
+    for line in result.stdout.splitlines():
+        fields = line.split(":")
+        if fields[0] in ("sec", "ssb") and len(fields) > 4:
+            key_ids.add(fields[4].upper())
+        elif fields[0] == "fpr" and len(fields) > 9:
+            key_ids.add(fields[9].upper())
+    return key_ids
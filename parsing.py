@@ -0,0 +1,329 @@
+"""Parsing decrypted pass entries into Proton Pass fields."""
+import json
+import os
+import re
+from dataclasses import dataclass, fields as dataclass_fields
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass
+class PassContent:  # pylint: disable=too-many-instance-attributes
+    """Data class representing a password entry for Proton Pass import."""
+    name: str
+    password: str
+    url: Optional[str] = None
+    email: Optional[str] = None
+    username: Optional[str] = None
+    note: Optional[str] = None
+    totp: Optional[str] = None
+    vault: Optional[str] = None
+
+
+# Classifies a line of an entry in one scan. The alternatives are tried in
+# order and the named group that matched is the kind of line, holding its value:
+# - totp: an otpauth://totp/ URI, as written by pass-otp, with a base32 `secret`
+#   parameter. It comes first because labels usually hold an email address.
+# - url: starts with 'url:', 'website:' or 'site:', in any case
+# - link: a bare http(s):// URL, alone on its line; also stored as the url.
+#   Like totp, both come before email as URLs may contain '@'.
+# - email: contains '@', as "email: user@example.com" (value after the first ':')
+#   or a bare "user@example.com". Other otpauth: URIs (hotp, or without a valid
+#   secret) are kept as notes rather than mistaken for emails.
+# - username: starts with 'username:', 'user:' or 'login:', in any case
+# - note: everything else (matches empty, the line itself is the note)
+_LINE_PATTERN = (
+    r"(?P<totp>(?i:otpauth://totp/)[^?#]*\?(?=(?:[^#]*&)?secret=[A-Za-z2-7]+=*(?:[&#]|$)).*)"
+    r"|(?i:url|website|site):(?P<url>.*)"
+    r"|(?P<link>(?i:https?://)[^\s/?#]+\S*)\Z"
+    r"|(?!(?i:otpauth):)(?=.*@)(?:[^:]*:)?(?P<email>.*)"
+    r"|(?i:username|user|login):(?P<username>.*)"
+    r"|(?P<note>)"
+)
+# PassContent field filled by each kind of line; notes are collected separately
+_LINE_FIELDS = {"totp": "totp", "url": "url", "link": "url", "email": "email",
+                "username": "username"}
+
+# Top-level domains accepted when looking for a domain in an entry name; anything
+# else, like "report.pdf", is not taken for a domain
+_GENERIC_TLDS = (
+    "com", "net", "org", "edu", "gov", "mil", "int", "info", "biz", "name", "pro",
+    "app", "dev", "io", "ai", "xyz", "online", "site", "tech", "store", "shop",
+    "cloud", "page", "blog", "email", "live", "link", "social", "network", "systems",
+)
+_COUNTRY_TLDS = frozenset("""
+    ac ad ae af ag ai al am ao aq ar as at au aw ax az ba bb bd be bf bg bh bi bj bm
+    bn bo br bs bt bw by bz ca cc cd cf cg ch ci ck cl cm cn co cr cu cv cw cx cy cz
+    de dj dk dm do dz ec ee eg er es et eu fi fj fk fm fo fr ga gd ge gf gg gh gi gl
+    gm gn gp gq gr gs gt gu gw gy hk hm hn hr ht hu id ie il im in io iq ir is it je
+    jm jo jp ke kg kh ki km kn kp kr kw ky kz la lb lc li lk lr ls lt lu lv ly ma mc
+    md me mg mh mk ml mm mn mo mp mq mr ms mt mu mv mw mx my mz na nc ne nf ng ni nl
+    no np nr nu nz om pa pe pf pg ph pk pl pm pn pr ps pt pw py qa re ro rs ru rw sa
+    sb sc sd se sg sh si sk sl sm sn so sr ss st su sv sx sy sz tc td tf tg th tj tk
+    tl tm tn to tr tt tv tw tz ua ug uk us uy uz va vc ve vg vi vn vu wf ws ye yt za
+    zm zw
+""".split())
+# Country codes that are more likely a file extension ("notes/readme.md",
+# "scripts/deploy.sh") or an abbreviation ("Bank/acct.no") in an entry name.
+# A wrong URL would be offered for autofill, a missing one only loses the fallback.
+_AMBIGUOUS_TLDS = frozenset(
+    "ac am as cc md mk ml mm mo ms no pl pm ps py rs sh so st tf".split())
+_NAME_DOMAIN = re.compile(
+    r"(?:.*/)?"
+    r"(?P<domain>(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+"
+    r"(?:" + "|".join(sorted(set(_GENERIC_TLDS) | (_COUNTRY_TLDS - _AMBIGUOUS_TLDS),
+                             key=len, reverse=True)) + r"))"
+    r"(?:/|\Z)",
+    re.ASCII | re.IGNORECASE | re.DOTALL,
+)
+
+
+# Columns of process_pass_many, in PassContent (and CSV) order
+PASS_FIELDS = [field.name for field in dataclass_fields(PassContent)]
+
+
+# Fields a parsing rule can fill; "note" keeps the line in the note
+RULE_FIELDS = ("url", "email", "username", "totp", "note")
+
+
+@dataclass(frozen=True)
+class ParseRule:
+    """
+    A parsing rule: lines starting with one of `prefixes` and a ':' (in any
+    case), or matching the regex `pattern` from the start of the line, fill
+    `field`. The value is what follows the ':', or for a pattern its group
+    named `value` if it has one and the whole line otherwise. Patterns are
+    combined into one regex, so they must not use numbered back-references.
+    """
+    field: str
+    prefixes: Tuple[str, ...] = ()
+    pattern: Optional[str] = None
+
+    def __post_init__(self):
+        if self.field not in RULE_FIELDS:
+            raise ValueError(f"unknown field {self.field!r}, expected one of {RULE_FIELDS}")
+        if not self.prefixes and self.pattern is None:
+            raise ValueError("a rule needs prefixes or a pattern")
+        if not all(isinstance(prefix, str) and prefix for prefix in self.prefixes):
+            raise ValueError("prefixes must be non-empty strings")
+        if self.pattern is not None:
+            try:
+                group_names = re.compile(self.pattern).groupindex
+            except (re.error, TypeError) as e:
+                raise ValueError(f"invalid pattern {self.pattern!r}: {e}") from e
+            if set(group_names) - {"value"}:
+                raise ValueError(f"pattern {self.pattern!r} may only name a group 'value'")
+
+
+def _trie_regex(node: dict) -> str:
+    """Regex for the strings of a trie, one alternative per distinct next character."""
+    branches = [re.escape(char) + _trie_regex(child)
+                for char, child in sorted(node.items()) if char]
+    if "" in node:
+        return f"(?:{'|'.join(branches)})?" if branches else ""
+    return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+
+def _prefix_regex(prefixes: Iterable[str]) -> str:
+    """
+    Regex matching any of `prefixes`, shaped like a trie so that matching
+    costs the length of the prefix, not the number of prefixes.
+    """
+    trie: dict = {}
+    for prefix in prefixes:
+        node = trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return _trie_regex(trie)
+
+
+class LineClassifier:
+    """
+    Sorts the lines of entries into PassContent fields, one regex match per line.
+
+    Rules are compiled together with the built-in classification into one
+    regex and take precedence over it: first all prefix rules at once, as a
+    single trie-shaped alternative (the first rule listing a prefix wins),
+    then the pattern rules in order. The cost of a line thus does not grow
+    with the number of prefixes. `default` is used wherever no classifier
+    is passed.
+    """
+
+    default: "LineClassifier"
+
+    def __init__(self, rules: Iterable[ParseRule] = ()):
+        # Lower-case prefix -> field of the first rule listing it (None for notes)
+        self._prefix_fields: Dict[str, Optional[str]] = {}
+        # Group named after the kind of line -> (field or None, group holding the value)
+        self._kinds: Dict[str, Tuple[Optional[str], str]] = {}
+        patterns = []
+        for rule in rules:
+            field = None if rule.field == "note" else rule.field
+            for prefix in rule.prefixes:
+                self._prefix_fields.setdefault(prefix.lower(), field)
+            if rule.pattern is not None:
+                patterns.append((field, rule.pattern))
+
+        alternatives = []
+        if self._prefix_fields:
+            alternatives.append(
+                rf"(?P<key>(?i:{_prefix_regex(self._prefix_fields)}))[ \t]*:(?P<keyed>.*)")
+            self._kinds["keyed"] = (None, "keyed")
+        for number, (field, pattern) in enumerate(patterns):
+            kind = f"rule{number}"
+            if "(?P<value>" in pattern:
+                pattern = pattern.replace("(?P<value>", f"(?P<{kind}_value>").replace(
+                    "(?P=value)", f"(?P={kind}_value)")
+                self._kinds[kind] = (field, f"{kind}_value")
+            else:
+                self._kinds[kind] = (field, kind)
+            alternatives.append(f"(?P<{kind}>{pattern})")
+        alternatives.append(_LINE_PATTERN)
+        self._kinds.update((kind, (_LINE_FIELDS.get(kind), kind))
+                           for kind in re.compile(_LINE_PATTERN).groupindex)
+
+        try:
+            self._matcher = re.compile("|".join(alternatives), re.ASCII | re.DOTALL)
+        except re.error as e:
+            raise ValueError(f"rules do not combine into one regex: {e}") from e
+
+    @classmethod
+    def load(cls, path: str) -> "LineClassifier":
+        """
+        Compile a JSON rules file, of the form
+        {"rules": [{"field": "username", "prefixes": ["login"]}, ...]}.
+
+        Raises OSError if it cannot be read and ValueError if it is invalid.
+        """
+        with open(os.path.expanduser(path), encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+            raise ValueError(f"{path}: expected an object with a \"rules\" list")
+
+        rules = []
+        for number, rule in enumerate(data["rules"], 1):
+            try:
+                if not isinstance(rule, dict) or set(rule) - {"field", "prefixes", "pattern"}:
+                    raise ValueError("expected an object with field, prefixes and/or pattern")
+                prefixes = rule.get("prefixes", ())
+                if isinstance(prefixes, str):
+                    prefixes = [prefixes]
+                rules.append(ParseRule(rule.get("field"), tuple(prefixes), rule.get("pattern")))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{path}: rule {number}: {e}") from e
+        return cls(rules)
+
+    def classify(self, lines: Iterable[str], fields: Dict[str, str], note_lines: List[str]):
+        """Sort the lines after the password into `fields` by PassContent field, or notes."""
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            # The last alternative matches anything, so every line gets a kind
+            match = self._matcher.match(line)
+            field, group = self._kinds[match.lastgroup]
+            if group == "keyed":
+                field = self._prefix_fields[match.group("key").lower()]
+            if field:
+                fields[field] = match.group(group).strip()
+            # Everything else goes to notes
+            else:
+                note_lines.append(line)
+
+
+LineClassifier.default = LineClassifier()
+
+
+def url_from_entry_name(entry_name: str) -> Optional[str]:
+    """
+    URL for an entry named after a site, e.g. https://example.com for
+    websites/example.com/login, or None if no part of the name is a domain.
+    """
+    # Most names have no dot at all, which rules out a domain without a regex
+    if "." not in entry_name:
+        return None
+    match = _NAME_DOMAIN.match(entry_name)
+    return f"https://{match.group('domain').lower()}" if match else None
+
+
+def process_pass(entry_name: str, raw_pass_content: str,
+                 classifier: Optional[LineClassifier] = None) -> PassContent:
+    """
+    Parse raw pass content into structured PassContent.
+
+    Expected format:
+    - First line: password
+    - Subsequent lines: key:value pairs or standalone values
+    - totp: an otpauth://totp/ URI with a base32 secret (pass-otp)
+    - url: 'url:', 'website:' or 'site:' prefix, or a bare http(s):// line;
+      otherwise derived from a domain in the entry name, if any
+    - email: detected by presence of '@' character
+    - username: detected by 'username:', 'user:', or 'login:' prefix
+    - note: everything else not categorized
+
+    `classifier` adds the rules of a rules file (see LineClassifier).
+    """
+    if not raw_pass_content:
+        return PassContent(
+            name=entry_name,
+            password="",
+            url=url_from_entry_name(entry_name)
+        )
+
+    lines = raw_pass_content.split('\n')
+    password = lines[0].strip() if lines else ""
+
+    fields: Dict[str, str] = {}
+    note_lines: List[str] = []
+    (classifier or LineClassifier.default).classify(lines[1:], fields, note_lines)
+    url = fields.pop("url", None) or url_from_entry_name(entry_name)
+
+    # Combine note lines, replacing literal '\n' with ' | ' to avoid CSV issues
+    note = ' | '.join(note_lines) if note_lines else None
+
+    return PassContent(
+        name=entry_name,
+        password=password,
+        url=url,
+        note=note,
+        **fields
+    )
+
+
+def process_pass_many(entry_names: Iterable[str], raw_pass_contents: Iterable[Optional[str]],
+                      classifier: Optional[LineClassifier] = None
+                      ) -> Dict[str, List[Optional[str]]]:
+    """
+    Parse a batch of entries into columns, one list per PassContent field.
+
+    Equivalent to calling process_pass on each (name, content) pair, with
+    column[i] holding the value for the i-th entry, but without creating a
+    PassContent per entry and with the scratch buffers reused across the
+    batch. The result only holds lists of strings, so batches can be parsed
+    in worker processes. Rows can be rebuilt from it with
+    PassContent(*values) for values in zip(*columns.values()).
+    """
+    classifier = classifier or LineClassifier.default
+    columns: Dict[str, List[Optional[str]]] = {name: [] for name in PASS_FIELDS}
+    parsed_columns = [(name, columns[name]) for name in PASS_FIELDS
+                      if name not in ("name", "password", "url", "note")]
+    fields: Dict[str, str] = {}
+    note_lines: List[str] = []
+
+    for entry_name, raw_pass_content in zip(entry_names, raw_pass_contents):
+        fields.clear()
+        note_lines.clear()
+        password = ""
+        if raw_pass_content:
+            lines = raw_pass_content.split('\n')
+            password = lines[0].strip()
+            classifier.classify(lines[1:], fields, note_lines)
+
+        columns["name"].append(entry_name)
+        columns["password"].append(password)
+        columns["url"].append(fields.get("url") or url_from_entry_name(entry_name))
+        columns["note"].append(' | '.join(note_lines) if note_lines else None)
+        for name, column in parsed_columns:
+            column.append(fields.get(name))
+    return columns
@@ -0,0 +1,653 @@
+"""Discovery of entries in a pass store."""
+import hashlib
+import json
+import os
+import re
+import subprocess
+from fnmatch import fnmatchcase
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+
+GPG_ID_FILE = ".gpg-id"
+
+
+@dataclass(frozen=True)
+class StoreEntry:
+    """A `.gpg` file in the store, as found by StoreIndex.scan()."""
+    name: str
+    path: str
+    size: int
+    mtime: float
+    inode: int
+    device: int = 0
+
+
+def index_order_key(name: str) -> Tuple[Tuple[int, str], ...]:
+    """
+    Sort key putting entry names in StoreIndex.scan() order.
+
+    Within a directory, entries (compared by file name) sort before
+    subdirectories (compared by directory name).
+    """
+    *directories, file_name = name.split("/")
+    return tuple((1, d) for d in directories) + ((0, file_name + ".gpg"),)
+
+
+def read_gpg_id(path: str) -> Tuple[str, ...]:
+    """
+    Recipients listed in a `.gpg-id` file.
+
+    As in pass, everything after a `#` is a comment and blank lines are
+    ignored. Returns an empty tuple if the file cannot be read.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return ()
+    recipients = (line.split("#", 1)[0].strip() for line in lines)
+    return tuple(recipient for recipient in recipients if recipient)
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """
+    Translate an entry glob to a regex.
+
+    `*` and `?` do not match `/`, and `**` matches any number of path
+    segments, so `work/**` matches everything below work/.
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            characters = pattern[i + 1:end]
+            if characters.startswith("!"):
+                characters = "^" + characters[1:]
+            regex += "[" + characters.replace("\\", "\\\\") + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return r"\A" + regex + r"\Z"
+
+
+def _could_contain(glob_segments: List[str], directory_segments: List[str]) -> bool:
+    """Whether a glob, split on `/`, can match an entry below the directory."""
+    for i, segment in enumerate(directory_segments):
+        if i < len(glob_segments) and glob_segments[i] == "**":
+            return True
+        # The glob's last segment matches the entry itself, not a directory
+        if i >= len(glob_segments) - 1 or not fnmatchcase(segment, glob_segments[i]):
+            return False
+    return True
+
+
+class EntryFilter:
+    """
+    Include and exclude patterns deciding which entries a run covers.
+
+    Patterns are globs over entry names (`work/**`, `*/db`), or regexes
+    searched anywhere in the name when prefixed with `re:`. An entry is
+    covered if it matches any include pattern (or there are none) and no
+    exclude pattern. Directories that cannot contain a covered entry are
+    pruned during the walk: those outside every include glob, and those an
+    exclude glob ending in `/**` drops entirely. Regexes never prune.
+    """
+
+    REGEX_PREFIX = "re:"
+
+    def __init__(self, include: Iterable[str] = (), exclude: Iterable[str] = ()):
+        include, exclude = list(include), list(exclude)
+        self.include = [self._compile(pattern) for pattern in include]
+        self.exclude = [self._compile(pattern) for pattern in exclude]
+
+        # With an include regex any directory may contain covered entries
+        self._include_globs: Optional[List[List[str]]] = [
+            pattern.split("/") for pattern in include
+        ]
+        if any(pattern.startswith(self.REGEX_PREFIX) for pattern in include):
+            self._include_globs = None
+        self._excluded_trees = [
+            re.compile(_glob_to_regex(pattern[:-3])) for pattern in exclude
+            if pattern.endswith("/**") and not pattern.startswith(self.REGEX_PREFIX)
+        ]
+
+    @classmethod
+    def _compile(cls, pattern: str) -> "re.Pattern":
+        if pattern.startswith(cls.REGEX_PREFIX):
+            return re.compile(pattern[len(cls.REGEX_PREFIX):])
+        return re.compile(_glob_to_regex(pattern))
+
+    def __bool__(self) -> bool:
+        return bool(self.include or self.exclude)
+
+    def matches(self, name: str) -> bool:
+        """Whether the entry `name` is covered."""
+        if self.include and not any(pattern.search(name) for pattern in self.include):
+            return False
+        return not any(pattern.search(name) for pattern in self.exclude)
+
+    def may_contain(self, directory: str) -> bool:
+        """Whether the store-relative `directory` may contain covered entries."""
+        if any(tree.search(directory) for tree in self._excluded_trees):
+            return False
+        if self._include_globs:
+            segments = directory.split("/")
+            return any(_could_contain(glob, segments) for glob in self._include_globs)
+        return True
+
+
+# A directory to scan, with the (device, inode) of it and every directory above it
+_Directory = Tuple[str, FrozenSet[Tuple[int, int]]]
+
+
+def _root_directory(pass_store_path: str) -> _Directory:
+    try:
+        stat = os.stat(pass_store_path)
+    except OSError:
+        # _scan_directory reports the error
+        return pass_store_path, frozenset()
+    return pass_store_path, frozenset({(stat.st_dev, stat.st_ino)})
+
+
+def _scan_directory(pass_store_path: str, directory: _Directory,
+                    entry_filter: Optional[EntryFilter] = None
+                    ) -> Tuple[List[StoreEntry], List[_Directory]]:
+    """
+    List one directory: its `.gpg` entries and the subdirectories to descend into.
+
+    Entries and subdirectories outside `entry_filter` are left out.
+    Symlinked directories are followed unless they lead back to a directory
+    above them, which would make the walk loop forever.
+    """
+    path, ancestors = directory
+    try:
+        with os.scandir(path) as it:
+            dir_entries = sorted(it, key=lambda e: e.name)
+    except OSError as e:
+        print(f"Could not read {path}: {e}")
+        return [], []
+
+    entries: List[StoreEntry] = []
+    subdirectories: List[_Directory] = []
+    for dir_entry in dir_entries:
+        relative_path = os.path.relpath(dir_entry.path, pass_store_path)
+        if dir_entry.is_dir():
+            if dir_entry.name == ".git" or (entry_filter
+                                            and not entry_filter.may_contain(relative_path)):
+                continue
+            stat = dir_entry.stat()
+            key = (stat.st_dev, stat.st_ino)
+            if key in ancestors:
+                print(f"Not following {dir_entry.path}: it links back to a parent directory")
+            else:
+                subdirectories.append((dir_entry.path, ancestors | {key}))
+        elif dir_entry.name.endswith(".gpg") and dir_entry.is_file():
+            if entry_filter and not entry_filter.matches(relative_path[:-4]):
+                continue
+            stat = dir_entry.stat()
+            entries.append(StoreEntry(
+                name=relative_path[:-4],
+                path=dir_entry.path,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                inode=stat.st_ino,
+                device=stat.st_dev,
+            ))
+    return entries, subdirectories
+
+
+def scan_parallel(pass_store_path: str, workers: int = 16,
+                  entry_filter: Optional[EntryFilter] = None) -> Iterator[StoreEntry]:
+    """
+    Yield the store's entries while up to `workers` directories are scanned at once.
+
+    Meant for large stores on high-latency filesystems such as NFS, where
+    listing directories one at a time dominates. Entries are yielded as soon
+    as their directory has been listed, in no particular order; use
+    StoreIndex.from_entries() to put them in index order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(_scan_directory, pass_store_path,
+                                   _root_directory(pass_store_path), entry_filter)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                entries, subdirectories = future.result()
+                for directory in subdirectories:
+                    pending.add(executor.submit(_scan_directory, pass_store_path, directory,
+                                                entry_filter))
+                yield from entries
+
+
+@dataclass(frozen=True)
+class PassStore:
+    """A password store taking part in a run, and the Proton Pass vault it goes to."""
+    path: str
+    vault: Optional[str] = None
+
+
+def default_vault(path: str) -> str:
+    """Vault name for a store without one: its directory name, e.g. `password-store`."""
+    return os.path.basename(os.path.normpath(path)).lstrip(".") or "pass"
+
+
+_GITCONFIG_SECTION = re.compile(r'\[\s*([\w.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]')
+
+
+def gopass_root_store() -> str:
+    """Where gopass keeps the root store when its config does not name one."""
+    data_home = os.getenv("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(data_home, "gopass", "stores", "root")
+
+
+def gopass_stores(config_path: str) -> List[PassStore]:
+    """
+    Stores mounted in a gopass config, each going to a vault named after its mount.
+
+    Reads the gitconfig-style config of gopass 1.12 and later: the root
+    store from `[mounts] path` and every mount from `[mounts "NAME"] path`.
+    gopass leaves out `[mounts] path` for a root store in its default
+    location (see gopass_root_store), which is used if it exists. The root
+    store's vault is `root`. Raises OSError if the config cannot be read.
+    """
+    stores: List[PassStore] = []
+    root: Optional[PassStore] = None
+    section: Optional[Tuple[str, Optional[str]]] = None
+    with open(os.path.expanduser(config_path), encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in "#;":
+                continue
+            header = _GITCONFIG_SECTION.fullmatch(line)
+            if header:
+                section = (header.group(1).lower(), header.group(2))
+                continue
+            key, _, value = line.partition("=")
+            if section and section[0] == "mounts" and key.strip().lower() == "path":
+                path = os.path.expanduser(value.strip().strip('"'))
+                if section[1] is None:
+                    root = PassStore(path, "root")
+                else:
+                    stores.append(PassStore(path, section[1]))
+    if root is None and os.path.isdir(gopass_root_store()):
+        root = PassStore(gopass_root_store(), "root")
+    return [root] + stores if root else stores
+
+
+def mount_stores(stores: List[PassStore], directory: str) -> Dict[str, PassStore]:
+    """
+    Make `directory` a store containing all `stores`, one symlink each.
+
+    Returns the store behind each symlink, named after its vault. As the
+    walk follows symlinked directories, indexing `directory` then indexes
+    every store at once, and each store's own `.gpg-id` still applies to
+    it. Symlinks left by earlier runs are replaced; nothing else in
+    `directory` is touched.
+    """
+    directory = os.path.expanduser(directory)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    with os.scandir(directory) as it:
+        for dir_entry in it:
+            if dir_entry.is_symlink():
+                os.unlink(dir_entry.path)
+
+    mounts: Dict[str, PassStore] = {}
+    for store in stores:
+        vault = store.vault or default_vault(store.path)
+        mount, suffix = vault.replace("/", "-"), 1
+        while mount in mounts:
+            suffix += 1
+            mount = f"{vault.replace('/', '-')}-{suffix}"
+        os.symlink(os.path.abspath(os.path.expanduser(store.path)),
+                   os.path.join(directory, mount))
+        mounts[mount] = PassStore(store.path, vault)
+    return mounts
+
+
+def _git(pass_store_path: str, *args: str) -> Optional[str]:
+    """Output of a git command run in the store, or None if it failed."""
+    try:
+        result = subprocess.run(["git", "-C", pass_store_path, *args],
+                                capture_output=True, text=True, check=False)
+    except OSError:
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def git_head(pass_store_path: str) -> Optional[str]:
+    """Commit checked out in a git-backed store, or None if it is not one."""
+    head = _git(pass_store_path, "rev-parse", "--verify", "--quiet", "HEAD")
+    return head.strip() if head else None
+
+
+class StoreIndex:
+    """
+    Every entry of a pass store, collected in one os.scandir traversal.
+
+    Each directory's entries come before its subdirectories', both in name
+    order, so runs over the same store always process entries in the same
+    order. The `.git` directory of git-backed stores is not descended into,
+    and symlinked directories are followed unless they form a cycle.
+    An index built with an `entry_filter` only holds the entries it covers.
+    """
+
+    def __init__(self, pass_store_path: str, entries: List[StoreEntry],
+                 entry_filter: Optional[EntryFilter] = None):
+        self.pass_store_path = pass_store_path
+        self.entries = entries
+        self.entry_filter = entry_filter
+        self._by_name: Dict[str, StoreEntry] = {entry.name: entry for entry in entries}
+        # Recipients in effect for each store-relative directory, "" being the root
+        self._recipients: Dict[str, Tuple[str, ...]] = {}
+
+    @classmethod
+    def scan(cls, pass_store_path: str,
+             entry_filter: Optional[EntryFilter] = None) -> "StoreIndex":
+        """Walk the store once and index every `.gpg` file in it."""
+        entries: List[StoreEntry] = []
+        stack = [_root_directory(pass_store_path)]
+        while stack:
+            found, subdirectories = _scan_directory(pass_store_path, stack.pop(), entry_filter)
+            entries.extend(found)
+            # Reversed so the stack pops subdirectories in name order
+            stack.extend(reversed(subdirectories))
+        return cls(pass_store_path, entries, entry_filter)
+
+    @classmethod
+    def from_entries(cls, pass_store_path: str, entries: Iterable[StoreEntry],
+                     entry_filter: Optional[EntryFilter] = None) -> "StoreIndex":
+        """Index entries found some other way, in the same order scan() uses."""
+        return cls(pass_store_path, sorted(entries, key=lambda e: index_order_key(e.name)),
+                   entry_filter)
+
+    @classmethod
+    def from_git(cls, pass_store_path: str,
+                 entry_filter: Optional[EntryFilter] = None) -> Optional["StoreIndex"]:
+        """
+        Index the `.gpg` files git tracks, without walking the filesystem.
+
+        Returns None if the store is not a git repository. Untracked entries
+        are not included.
+        """
+        listing = _git(pass_store_path, "ls-files", "-z", "--", "*.gpg")
+        if listing is None:
+            return None
+
+        entries: List[StoreEntry] = []
+        for relative_path in listing.split("\0"):
+            if not relative_path or (entry_filter
+                                     and not entry_filter.matches(relative_path[:-4])):
+                continue
+            path = os.path.join(pass_store_path, relative_path)
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                print(f"Could not read {path}: {e}")
+                continue
+            entries.append(StoreEntry(
+                name=relative_path[:-4],
+                path=path,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                inode=stat.st_ino,
+                device=stat.st_dev,
+            ))
+        return cls.from_entries(pass_store_path, entries, entry_filter)
+
+    def covers(self, name: str) -> bool:
+        """Whether `name` would be in this index if it existed in the store."""
+        return not self.entry_filter or self.entry_filter.matches(name)
+
+    def _directory_recipients(self, directory: str) -> Tuple[str, ...]:
+        if directory not in self._recipients:
+            recipients = read_gpg_id(os.path.join(self.pass_store_path, directory, GPG_ID_FILE))
+            if not recipients and directory:
+                recipients = self._directory_recipients(os.path.dirname(directory))
+            self._recipients[directory] = recipients
+        return self._recipients[directory]
+
+    def recipients(self, name: str) -> Tuple[str, ...]:
+        """
+        Keys the entry `name` is encrypted to, from the nearest `.gpg-id` above it.
+
+        Like pass, a subdirectory's `.gpg-id` overrides its parents'. Each
+        directory's file is read at most once per index.
+        """
+        return self._directory_recipients(os.path.dirname(name))
+
+    def recipient_groups(self) -> Dict[Tuple[str, ...], List[StoreEntry]]:
+        """Entries grouped by recipients, groups and entries in index order."""
+        groups: Dict[Tuple[str, ...], List[StoreEntry]] = {}
+        for entry in self.entries:
+            groups.setdefault(self.recipients(entry.name), []).append(entry)
+        return groups
+
+    def names(self) -> List[str]:
+        """Entry names (store-relative, without .gpg) in index order."""
+        return [entry.name for entry in self.entries]
+
+    def get(self, name: str) -> StoreEntry:
+        """Look up an entry by name; raises KeyError if it is not in the store."""
+        return self._by_name[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __iter__(self) -> Iterator[StoreEntry]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, as hex."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_duplicates(entries: Iterable[StoreEntry]) -> Dict[str, List[str]]:
+    """
+    Map each entry that has duplicates to the names of its duplicates.
+
+    Entries are duplicates if they are the same file (hard links, or one
+    file reached through symlinks), by (device, inode), or if their
+    ciphertext is byte-for-byte identical (copies). Only entries the same
+    size as another are hashed. The first entry of each set, in iteration
+    order, is the one mapped to the others.
+    """
+    duplicates: Dict[str, List[str]] = {}
+    by_file: Dict[Tuple[int, int], StoreEntry] = {}
+    by_size: Dict[int, List[StoreEntry]] = {}
+    for entry in entries:
+        first = by_file.setdefault((entry.device, entry.inode), entry)
+        if first is entry:
+            by_size.setdefault(entry.size, []).append(entry)
+        else:
+            duplicates.setdefault(first.name, []).append(entry.name)
+
+    for same_size in by_size.values():
+        by_digest: Dict[str, StoreEntry] = {}
+        for entry in same_size if len(same_size) > 1 else ():
+            try:
+                first = by_digest.setdefault(file_digest(entry.path), entry)
+            except OSError:
+                continue
+            if first is not entry:
+                duplicates.setdefault(first.name, []).append(entry.name)
+                duplicates[first.name].extend(duplicates.pop(entry.name, []))
+    return duplicates
+
+
+@dataclass
+class ManifestDiff:
+    """How the store changed since the manifest was written, by entry name."""
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        """One-line count of each kind of change."""
+        return (f"{len(self.added)} added, {len(self.changed)} changed, "
+                f"{len(self.unchanged)} unchanged, {len(self.deleted)} deleted")
+
+
+class StoreManifest:
+    """
+    Record of the store as of the last run.
+
+    For every entry it keeps the relative path, size, mtime, inode and the
+    SHA-256 of its ciphertext, and for git-backed stores the exported
+    `commit`.
+    classify() compares a fresh StoreIndex against it without decrypting
+    anything. Entries whose size, mtime and inode all match are taken as
+    unchanged without being read; the others are hashed, so an entry that was
+    only touched still counts as unchanged. classify_git() asks git instead.
+    """
+
+    VERSION = 1
+
+    def __init__(self, entries: Optional[Dict[str, dict]] = None,
+                 commit: Optional[str] = None):
+        self.entries: Dict[str, dict] = entries or {}
+        self.commit = commit
+        self._digests: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "StoreManifest":
+        """Read a manifest, or return an empty one if there is none yet."""
+        path = os.path.expanduser(path)
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable manifest {path}: {e}")
+            return cls()
+        if data.get("version") != cls.VERSION:
+            print(f"Ignoring manifest {path} written by another version")
+            return cls()
+        return cls(data.get("entries", {}), data.get("commit"))
+
+    def save(self, path: str):
+        """Write the manifest, readable only by the current user."""
+        path = os.path.expanduser(path)
+        manifest_dir = os.path.dirname(path)
+        if manifest_dir and not os.path.exists(manifest_dir):
+            os.makedirs(manifest_dir, mode=0o700)
+
+        tmp_path = path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "commit": self.commit,
+                       "entries": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def _same_stat(self, entry: StoreEntry) -> bool:
+        recorded = self.entries.get(entry.name)
+        return (recorded is not None and recorded["size"] == entry.size
+                and recorded["mtime"] == entry.mtime and recorded["inode"] == entry.inode)
+
+    def digest(self, entry: StoreEntry) -> str:
+        """Ciphertext hash of an entry, reusing the recorded one when its stat matches."""
+        if entry.name not in self._digests:
+            if self._same_stat(entry):
+                self._digests[entry.name] = self.entries[entry.name]["sha256"]
+            else:
+                self._digests[entry.name] = file_digest(entry.path)
+        return self._digests[entry.name]
+
+    def _classify(self, store_index: StoreIndex,
+                  is_changed: Callable[[StoreEntry], bool]) -> ManifestDiff:
+        diff = ManifestDiff()
+        for entry in store_index:
+            if entry.name not in self.entries:
+                diff.added.append(entry.name)
+            elif is_changed(entry):
+                diff.changed.append(entry.name)
+            else:
+                diff.unchanged.append(entry.name)
+        diff.deleted = sorted(name for name in self.entries
+                              if name not in store_index and store_index.covers(name))
+        return diff
+
+    def classify(self, store_index: StoreIndex) -> ManifestDiff:
+        """Sort the index's entries into added, changed, unchanged and deleted."""
+        return self._classify(
+            store_index, lambda entry: self.digest(entry) != self.entries[entry.name]["sha256"])
+
+    def classify_git(self, store_index: StoreIndex) -> Optional[ManifestDiff]:
+        """
+        Like classify(), but take changes from `git diff` since `commit`.
+
+        Nothing is hashed. Entries missing from the manifest, such as ones
+        that failed to export last time, still count as added. Returns None if
+        there is no recorded commit or git cannot diff against it, e.g. after
+        the history was rewritten.
+        """
+        if self.commit is None:
+            return None
+        # --relative gives store-relative paths, as ls-files does, when the
+        # store is a subdirectory of the repository
+        listing = _git(store_index.pass_store_path, "diff", "--name-status", "-z",
+                       "--no-renames", "--relative", f"{self.commit}..HEAD", "--", "*.gpg")
+        if listing is None:
+            return None
+
+        # -z output alternates status and path: "M\0a.gpg\0D\0b.gpg\0"
+        fields = listing.split("\0")
+        modified = {path[:-4] for status, path in zip(fields[::2], fields[1::2])
+                    if status != "D"}
+        return self._classify(store_index, lambda entry: entry.name in modified)
+
+    def record(self, store_index: StoreIndex, names: Iterable[str],
+               unchanged: Iterable[str] = ()):
+        """
+        Make the manifest describe `names` as they are in `store_index`.
+
+        `unchanged` entries were not exported again and keep what was
+        recorded for them, unless classify() hashed them and so knows their
+        current state matches. Other entries the index covers are dropped, so
+        entries that were deleted, or that could not be exported, show up as
+        added on the next run. Entries outside its filter were not looked at
+        and are kept.
+        """
+        unchanged = list(unchanged)
+        kept = {name: self.entries[name] for name in unchanged
+                if name in self.entries and name not in self._digests}
+        names = [name for name in [*names, *unchanged] if name not in kept]
+        self.entries = {name: recorded for name, recorded in self.entries.items()
+                        if not store_index.covers(name)}
+        self.entries.update(kept)
+        self.entries.update({
+            name: {
+                "path": os.path.relpath(entry.path, store_index.pass_store_path),
+                "size": entry.size,
+                "mtime": entry.mtime,
+                "inode": entry.inode,
+                "sha256": self.digest(entry),
+            }
+            for name in names
+            for entry in [store_index.get(name)]
+        })
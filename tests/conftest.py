@@ -0,0 +1,31 @@
+"""Shared fixtures: plaintext stores and the fake decryption backend."""
+from typing import Callable, Dict
+
+import pytest
+
+import migrate
+from backends import FakeBackend
+
+
+@pytest.fixture
+def make_store(tmp_path) -> Callable[[Dict[str, str]], str]:
+    """Return a function writing {entry name: content} as plaintext `.gpg` files."""
+    def make(entries: Dict[str, str]) -> str:
+        store = tmp_path / "store"
+        store.mkdir(exist_ok=True)
+        for name, content in entries.items():
+            path = store / (name + ".gpg")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content, encoding="utf-8")
+        return str(store)
+    return make
+
+
+@pytest.fixture
+def fake_backend(monkeypatch) -> Callable[..., FakeBackend]:
+    """Return a function installing one FakeBackend(**options) for every read_entries run."""
+    def install(**options) -> FakeBackend:
+        backend = FakeBackend(**options)
+        monkeypatch.setattr(migrate, "get_backend", lambda name, **_: backend)
+        return backend
+    return install
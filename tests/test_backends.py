@@ -0,0 +1,391 @@
+"""Tests for the decryption backends."""
+# pylint: disable=protected-access
+import asyncio
+import hashlib
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+import backends
+from backends import (BackendUnavailableError, FakeBackend, PgpBackend, SessionKeyCache,
+                      classify_failure, read_gpg, read_gpg_batch, read_pass_async)
+
+posix_only = pytest.mark.skipif(sys.platform == "win32",
+                                reason="needs a POSIX shell and process groups")
+
+
+def test_fake_backend_errors_once_per_message(make_store):
+    """A list of messages fails once with each, then the entry decrypts."""
+    store = make_store({"a": "pw-a\n"})
+    errors = []
+    backend = FakeBackend(errors={"a": ["gpg: timeout", "gpg: No secret key"]})
+    backend.on_error = errors.append
+    path = os.path.join(store, "a.gpg")
+
+    assert [backend.decrypt_one("a", path) for _ in range(3)] == [None, None, "pw-a"]
+    assert [error.reason for error in errors] == ["other", "no-secret-key"]
+    assert backend.decrypted == ["a", "a", "a"]
+
+
+@pytest.mark.parametrize("stderr, reason", [
+    ("gpg: decryption failed: No secret key", "no-secret-key"),
+    ("gpg: public key decryption failed: Bad passphrase", "bad-passphrase"),
+    ("gpg: public key decryption failed: Inappropriate ioctl for device", "pinentry"),
+    ("gpg: can't connect to the agent: IPC connect call failed", "agent"),
+    ("gpg: [don't know]: invalid packet (ctb=2d)", "other"),
+])
+def test_classify_failure(stderr, reason):
+    """gpg's error output maps to the reason the breaker and retries act on."""
+    assert classify_failure(stderr) == reason
+
+
+def stub_pass(directory, monkeypatch) -> str:
+    """
+    Put a `pass` first on PATH that, like pass waiting on gpg, starts a child
+    holding its output. The child writes its PID to the returned file.
+    """
+    pid_file = directory / "child.pid"
+    stub = directory / "pass"
+    stub.write_text(f"#!/bin/sh\nsleep 30 &\necho $! > {pid_file}\nwait\n", encoding="utf-8")
+    stub.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{directory}{os.pathsep}{os.environ.get('PATH', '')}")
+    return str(pid_file)
+
+
+def alive(pid: int) -> bool:
+    """Whether `pid` is a live process, not counting zombies nobody reaped yet."""
+    try:
+        os.kill(pid, 0)
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+
+
+def running(pid: int) -> bool:
+    """Whether `pid` is still alive a second later, allowing for the kill to land."""
+    deadline = time.monotonic() + 1
+    while alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return alive(pid)
+
+
+def child_pid(pid_file: str) -> int:
+    """PID the stub's child wrote, once it has."""
+    for _ in range(100):
+        if os.path.exists(pid_file):
+            with open(pid_file, encoding="utf-8") as f:
+                pid = f.read().strip()
+            if pid:
+                return int(pid)
+        time.sleep(0.01)
+    raise AssertionError("the stub pass did not start its child")
+
+
+@posix_only
+def test_read_pass_async_timeout_kills_children(tmp_path, monkeypatch):
+    """On timeout pass is killed with the process it started, which holds its output."""
+    pid_file = stub_pass(tmp_path, monkeypatch)
+    errors = []
+
+    start = time.monotonic()
+    content = asyncio.run(read_pass_async("entry", timeout=0.5, on_error=errors.append))
+    assert content is None
+    assert time.monotonic() - start < 3
+    assert [error.reason for error in errors] == ["timeout"]
+    assert not running(child_pid(pid_file))
+
+
+@posix_only
+def test_read_pass_async_cancel_kills_children(tmp_path, monkeypatch):
+    """Cancelling the read does not leave pass or its children running."""
+    pid_file = stub_pass(tmp_path, monkeypatch)
+
+    async def cancel_read():
+        task = asyncio.ensure_future(read_pass_async("entry", timeout=30))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_read())
+    pid = child_pid(pid_file)
+    try:
+        assert not running(pid)
+    finally:
+        if alive(pid):
+            os.kill(pid, signal.SIGKILL)
+
+
+# gpg --decrypt-files output, status and messages merged, for: a decrypted file,
+# a missing key, a key whose passphrase could not be asked for, and a non-OpenPGP file
+DECRYPT_FILES_OUTPUT = """\
+[GNUPG:] FILE_START 3 0.gpg
+[GNUPG:] ENC_TO 7ED473EEB3C0F11C 1 0
+[GNUPG:] BEGIN_DECRYPTION
+[GNUPG:] DECRYPTION_OKAY
+[GNUPG:] END_DECRYPTION
+[GNUPG:] FILE_DONE
+[GNUPG:] FILE_START 3 1.gpg
+[GNUPG:] ENC_TO 49A83CFF1F024024 1 0
+[GNUPG:] BEGIN_DECRYPTION
+[GNUPG:] DECRYPTION_FAILED
+gpg: decryption failed: No secret key
+[GNUPG:] END_DECRYPTION
+[GNUPG:] FILE_DONE
+[GNUPG:] FILE_START 3 2.gpg
+[GNUPG:] ENC_TO 86052E53941D9AC0 1 0
+[GNUPG:] PINENTRY_LAUNCHED 27587 curses 1.2.1 - xterm - - 0/0 -
+[GNUPG:] BEGIN_DECRYPTION
+[GNUPG:] DECRYPTION_FAILED
+gpg: decryption failed: No secret key
+[GNUPG:] END_DECRYPTION
+[GNUPG:] FILE_DONE
+[GNUPG:] FILE_START 3 3.gpg
+[GNUPG:] NODATA 3
+[GNUPG:] FILE_DONE
+"""
+
+
+def test_batch_failures_are_classified_per_file(tmp_path):
+    """Messages without a file name are attributed by the status lines around them."""
+    (tmp_path / "0").write_text("pw-a\n", encoding="utf-8")
+    errors = []
+    entries = [(name, "") for name in ["a", "b", "c", "d"]]
+
+    results = backends._collect_batch_output(str(tmp_path), entries, DECRYPT_FILES_OUTPUT,
+                                             True, errors.append)
+    assert results == ["pw-a", None, None, None]
+    assert [(error.entry_name, error.reason) for error in errors] == [
+        ("b", "no-secret-key"), ("c", "pinentry"), ("d", "other")]
+    assert str(errors[0]) == "Error reading b: gpg: decryption failed: No secret key"
+    assert str(errors[2]) == "Error reading d: gpg reported NODATA 3"
+    assert not list(tmp_path.iterdir())
+
+
+def test_batch_timeout_fails_unfinished_files(tmp_path):
+    """When gpg is killed, files it did not decrypt fail with a timeout."""
+    errors = []
+    results = backends._collect_batch_output(str(tmp_path), [("a", ""), ("b", "")],
+                                             DECRYPT_FILES_OUTPUT, False, errors.append)
+    assert results == [None, None]
+    assert [error.reason for error in errors] == ["timeout", "timeout"]
+
+
+@pytest.fixture(name="gpg_home", scope="module")
+def fixture_gpg_home(tmp_path_factory):
+    """
+    A GNUPGHOME with a passphrase-less key for test@example.com and only the
+    public key of other@example.com. Returns its environment.
+    """
+    if shutil.which("gpg") is None:
+        pytest.skip("gpg is not installed")
+    home = tmp_path_factory.mktemp("gnupg")
+    home.chmod(0o700)
+    env = {**os.environ, "GNUPGHOME": str(home)}
+
+    def gpg(*args, **kwargs):
+        return subprocess.run(["gpg", "--batch", *args], env=env, check=True,
+                              capture_output=True, **kwargs).stdout
+
+    for uid in ["test@example.com", "other@example.com"]:
+        gpg("--passphrase", "", "--quick-generate-key", uid, "future-default", "default", "never")
+    listing = gpg("--with-colons", "--list-secret-keys", "other@example.com").decode()
+    fingerprints = [line.split(":")[9] for line in listing.splitlines()
+                    if line.startswith("fpr")]
+    gpg("--yes", "--delete-secret-keys", fingerprints[0])
+    yield env
+    subprocess.run(["gpgconf", "--kill", "gpg-agent"], env=env, check=False,
+                   capture_output=True)
+
+
+def encrypt(env: dict, path, recipient: str, text: str):
+    """Encrypt `text` to `recipient` into `path`."""
+    subprocess.run(["gpg", "--batch", "--yes", "--trust-model", "always", "--encrypt",
+                    "--recipient", recipient, "--output", str(path)],
+                   input=text.encode(), env=env, check=True, capture_output=True)
+
+
+def test_read_gpg_batch(tmp_path, gpg_home):
+    """One gpg process decrypts the batch; each failure keeps its own reason."""
+    encrypt(gpg_home, tmp_path / "a.gpg", "test@example.com", "pw-a\nuser: alice\n")
+    encrypt(gpg_home, tmp_path / "b.gpg", "other@example.com", "pw-b")
+    (tmp_path / "c.gpg").write_text("not encrypted", encoding="utf-8")
+    encrypt(gpg_home, tmp_path / "d.gpg", "test@example.com", "pw-d")
+    errors = []
+
+    entries = [(name, str(tmp_path / f"{name}.gpg")) for name in ["a", "b", "c", "d"]]
+    results = read_gpg_batch(entries, env=gpg_home, on_error=errors.append)
+    assert results == ["pw-a\nuser: alice", None, None, "pw-d"]
+    assert [(error.entry_name, error.reason) for error in errors] == [
+        ("b", "no-secret-key"), ("c", "other")]
+    assert "No secret key" in str(errors[0])
+
+
+def digest(path) -> str:
+    """Ciphertext hash the session key cache is keyed by."""
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_session_key_cache_decrypts_without_the_secret_key(tmp_path, gpg_home):
+    """A saved session key opens its file even where the secret key is missing."""
+    entry = tmp_path / "a.gpg"
+    encrypt(gpg_home, entry, "test@example.com", "pw-a\nuser: alice")
+    cache_file = tmp_path / "cache" / "session-keys.gpg"
+    cache = SessionKeyCache(str(cache_file))
+    cache.load(gpg_home)
+    assert cache.read_entry("a", str(entry), env=gpg_home) == "pw-a\nuser: alice"
+    cache.save(gpg_home)
+    assert digest(entry).encode() not in cache_file.read_bytes()
+
+    cache = SessionKeyCache(str(cache_file))
+    cache.load(gpg_home)
+    empty_home = tmp_path / "empty"
+    empty_home.mkdir(mode=0o700)
+    without_key = {**gpg_home, "GNUPGHOME": str(empty_home)}
+    assert cache.read_entry("a", str(entry), env=without_key) == "pw-a\nuser: alice"
+    subprocess.run(["gpgconf", "--kill", "gpg-agent"], env=without_key, check=False,
+                   capture_output=True)
+
+
+def test_session_key_cache_keeps_only_keys_read_in_the_run(tmp_path, gpg_home):
+    """Keys for ciphertexts that were not read again are dropped on save."""
+    entries = {name: tmp_path / f"{name}.gpg" for name in ["a", "b"]}
+    for name, path in entries.items():
+        encrypt(gpg_home, path, "test@example.com", f"pw-{name}")
+    cache_file = str(tmp_path / "session-keys.gpg")
+
+    def read(*names):
+        cache = SessionKeyCache(cache_file)
+        cache.load(gpg_home)
+        for name in names:
+            cache.read_entry(name, str(entries[name]), env=gpg_home)
+        cache.save(gpg_home)
+
+    def cached_digests():
+        cache = SessionKeyCache(cache_file)
+        cache.load(gpg_home)
+        return set(cache._keys)
+
+    read("a", "b")
+    old_b = digest(entries["b"])
+    assert cached_digests() == {digest(entries["a"]), old_b}
+
+    encrypt(gpg_home, entries["b"], "test@example.com", "pw-b2")
+    read("a", "b")
+    assert cached_digests() == {digest(entries["a"]), digest(entries["b"])}
+
+    read("a")
+    assert cached_digests() == {digest(entries["a"])}
+
+
+def new_pgpy_key(bits: int = 2048):
+    """A PGPy encryption key for test@example.com."""
+    pgpy = pytest.importorskip("pgpy")
+    # pylint: disable=import-outside-toplevel
+    from pgpy.constants import (CompressionAlgorithm, HashAlgorithm, KeyFlags, PubKeyAlgorithm,
+                                SymmetricKeyAlgorithm)
+
+    key = pgpy.PGPKey.new(PubKeyAlgorithm.RSAEncryptOrSign, bits)
+    key.add_uid(pgpy.PGPUID.new("Test", email="test@example.com"),
+                usage={KeyFlags.Sign, KeyFlags.EncryptCommunications, KeyFlags.EncryptStorage},
+                hashes=[HashAlgorithm.SHA256], ciphers=[SymmetricKeyAlgorithm.AES256],
+                compression=[CompressionAlgorithm.Uncompressed])
+    return key
+
+
+@pytest.fixture(name="pgp_key", scope="module")
+def fixture_pgp_key(tmp_path_factory):
+    """
+    An RSA key with an encryption subkey, made by gpg for test@example.com:
+    (its encryption subkey loaded in PGPy, the exported secret key file,
+    GNUPGHOME holding it).
+    """
+    pgpy = pytest.importorskip("pgpy")
+    if shutil.which("gpg") is None:
+        pytest.skip("gpg is not installed")
+
+    directory = tmp_path_factory.mktemp("pgp")
+    home = directory / "gnupg"
+    home.mkdir(mode=0o700)
+    env = {**os.environ, "GNUPGHOME": str(home)}
+    gpg = ["gpg", "--batch", "--pinentry-mode", "loopback", "--passphrase", ""]
+    subprocess.run([*gpg, "--quick-generate-key", "Test <test@example.com>", "rsa2048",
+                    "sign,cert", "never"], env=env, check=True, capture_output=True)
+    listing = subprocess.run(["gpg", "--with-colons", "--list-keys", "test@example.com"],
+                             env=env, check=True, capture_output=True, text=True).stdout
+    fingerprint = [line.split(":")[9] for line in listing.splitlines()
+                   if line.startswith("fpr")][0]
+    subprocess.run([*gpg, "--quick-add-key", fingerprint, "rsa2048", "encr", "never"],
+                   env=env, check=True, capture_output=True)
+    key_file = directory / "key.asc"
+    subprocess.run([*gpg, "--armor", "--output", str(key_file), "--export-secret-keys",
+                    "test@example.com"], env=env, check=True, capture_output=True)
+    key, _ = pgpy.PGPKey.from_file(str(key_file))
+    yield list(key.subkeys.values())[0], str(key_file), env
+    subprocess.run(["gpgconf", "--kill", "gpg-agent"], env=env, check=False,
+                   capture_output=True)
+
+
+SAMPLES = [
+    "hunter2",
+    "p\u00e4ssword  \r\nuser: bob\n\nnote line\t\n",
+    "x" * 2000 + "\nurl: https://example.com",
+]
+
+
+@pytest.mark.filterwarnings("ignore")
+@pytest.mark.parametrize("encrypt_with", ["pgpy", "gpg"])
+@pytest.mark.parametrize("sample", SAMPLES)
+def test_pgp_backend_matches_gpg(tmp_path, pgp_key, encrypt_with, sample):
+    """The in-process backend returns what gpg does, for files PGPy or gpg encrypted."""
+    pgpy = pytest.importorskip("pgpy")
+    key, key_file, env = pgp_key
+    path = tmp_path / "entry.gpg"
+    if encrypt_with == "pgpy":
+        path.write_bytes(bytes(key.pubkey.encrypt(pgpy.PGPMessage.new(sample))))
+    else:
+        encrypt(env, path, "test@example.com", sample)
+
+    expected = read_gpg("entry", str(path), env=env)
+    assert expected is not None
+    backend = PgpBackend(secret_key_file=key_file)
+    backend.open()
+    try:
+        assert backend.decrypt_one("entry", str(path)) == expected
+    finally:
+        backend.close()
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_pgp_backend_rejects_unusable_keys(tmp_path):
+    """A missing, malformed or locked key stops the backend from opening, with a reason."""
+    pgpy = pytest.importorskip("pgpy")
+    key = new_pgpy_key(1024)
+    key.protect("right", pgpy.constants.SymmetricKeyAlgorithm.AES256,
+                pgpy.constants.HashAlgorithm.SHA256)
+    protected = tmp_path / "protected.asc"
+    protected.write_text(str(key), encoding="utf-8")
+    garbage = tmp_path / "garbage.asc"
+    garbage.write_text("not a key", encoding="utf-8")
+
+    for key_file, passphrase, reason in [
+            ("", None, "GPG_SECRET_KEY_FILE"),
+            (tmp_path / "missing.asc", None, "Cannot read"),
+            (garbage, None, "Cannot read"),
+            (protected, None, "passphrase is required"),
+            (protected, "wrong", "does not unlock")]:
+        backend = PgpBackend(passphrase=passphrase, secret_key_file=str(key_file))
+        with pytest.raises(BackendUnavailableError, match=reason):
+            backend.open()
+
+    backend = PgpBackend(passphrase="right", secret_key_file=str(protected))
+    backend.open()
+    backend.close()
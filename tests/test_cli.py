@@ -0,0 +1,56 @@
+"""Tests for the command line options of migrate."""
+import pytest
+
+from migrate import assign_vaults, parse_args, resolve_stores
+from parsing import PassContent
+from store import PassStore
+
+
+def test_pgp_backend_needs_a_key_file(tmp_path, monkeypatch, capsys):
+    """--backend pgp fails before anything runs when there is no key file to use."""
+    monkeypatch.delenv("GPG_SECRET_KEY_FILE", raising=False)
+    with pytest.raises(SystemExit):
+        parse_args(["--backend", "pgp"])
+    assert "GPG_SECRET_KEY_FILE" in capsys.readouterr().err
+
+    monkeypatch.setenv("GPG_SECRET_KEY_FILE", str(tmp_path / "missing.asc"))
+    with pytest.raises(SystemExit):
+        parse_args(["--backend", "pgp"])
+
+    key_file = tmp_path / "key.asc"
+    key_file.write_text("", encoding="utf-8")
+    monkeypatch.setenv("GPG_SECRET_KEY_FILE", str(key_file))
+    assert parse_args(["--backend", "pgp"]).backend == "pgp"
+
+
+@pytest.mark.parametrize("backend", ["pass", "gpg-batch", "pgp"])
+def test_session_key_cache_needs_the_gpg_backend(backend, capsys):
+    """Backends that would ignore the cache reject the option."""
+    with pytest.raises(SystemExit):
+        parse_args(["--backend", backend, "--session-key-cache"])
+    assert "--backend gpg" in capsys.readouterr().err
+    assert parse_args(["--backend", "gpg", "--session-key-cache"]).session_key_cache
+
+
+def test_gopass_config_without_stores(tmp_path, monkeypatch):
+    """A gopass config that is missing or names no store stops the run with a message."""
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    config = tmp_path / "config"
+    with pytest.raises(SystemExit, match="Cannot read the gopass config"):
+        resolve_stores(parse_args(["--gopass", str(config)]))
+
+    config.write_text("[core]\n\tautosync = true\n", encoding="utf-8")
+    with pytest.raises(SystemExit, match="No stores found"):
+        resolve_stores(parse_args(["--gopass", str(config)]))
+
+
+def test_assign_vaults():
+    """Rows go to the vault of their store, losing the mount prefix of a combined run."""
+    rows = [PassContent("Work/a", "1"), PassContent("home/dir/b", "2")]
+    assert assign_vaults(rows) == rows
+    assert [row.vault for row in assign_vaults(rows, {"": PassStore("/s", "Personal")})] == [
+        "Personal", "Personal"]
+
+    mounts = {"Work": PassStore("/work", "Work"), "home": PassStore("/home", "Home")}
+    assert [(row.name, row.vault) for row in assign_vaults(rows, mounts)] == [
+        ("a", "Work"), ("dir/b", "Home")]
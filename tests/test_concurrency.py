@@ -0,0 +1,185 @@
+"""Tests for the adaptive concurrency controller, circuit breaker and retry policy."""
+import threading
+import time
+
+import pytest
+
+from backends import DecryptionError
+from concurrency import AIMDController, CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def failure(reason: str, entry_name: str = "entry") -> DecryptionError:
+    """A DecryptionError with the given reason."""
+    return DecryptionError(entry_name, "failed", reason)
+
+
+def outcome_controller(**options) -> AIMDController:
+    """A controller that backs off on failures only, not on sub-millisecond latency noise."""
+    controller = AIMDController(**options)
+    controller.latency_factor = float("inf")
+    return controller
+
+
+def run(controller: AIMDController, outcomes):
+    """Run one decryption per outcome through the controller, one at a time."""
+    for failed in outcomes:
+        with controller.slot() as slot:
+            slot[0] = failed
+
+
+def test_limit_grows_after_a_window_of_successes():
+    """Each window of `limit` successes raises the limit by one, up to the maximum."""
+    controller = outcome_controller(initial=2, maximum=4)
+    run(controller, [False] * 2)
+    assert controller.limit == 3
+    run(controller, [False] * 3)
+    assert controller.limit == 4
+    run(controller, [False] * 20)
+    assert controller.history == [2, 3, 4]
+
+
+def test_failure_halves_the_limit_down_to_the_minimum():
+    """A failure multiplies the limit by `decrease`, never going below the minimum."""
+    controller = outcome_controller(initial=8, minimum=3)
+    run(controller, [True])
+    assert controller.limit == 4
+    run(controller, [True])
+    assert controller.limit == 3
+
+
+def test_one_decrease_per_burst_of_failures():
+    """Failures of decryptions started before a back-off do not back off again."""
+    controller = outcome_controller(initial=8)
+    slots = [controller.slot() for _ in range(4)]
+    failed = [slot.__enter__() for slot in slots]  # pylint: disable=unnecessary-dunder-call
+    for flag, slot in zip(failed, slots):
+        flag[0] = True
+        slot.__exit__(None, None, None)
+    assert controller.history == [8, 4]
+
+
+def test_slow_decryptions_count_as_congestion():
+    """Latency far above the fastest seen backs off like a failure."""
+    controller = AIMDController(initial=4)
+    controller.latency_factor = 3.0
+    run(controller, [False])
+    with controller.slot():
+        time.sleep(0.05)
+    assert controller.limit == 2
+
+
+def test_slot_blocks_at_the_limit():
+    """No more than `limit` decryptions are ever in flight."""
+    controller = AIMDController(initial=2, maximum=2)
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def decrypt():
+        with controller.slot():
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.pop()
+
+    threads = [threading.Thread(target=decrypt) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 2
+
+
+def test_settled_limit_and_summary():
+    """The settled limit is the most common one in the second half of the run."""
+    controller = AIMDController(initial=4)
+    controller.history = [4, 5, 6, 3, 4, 3, 3]
+    assert controller.settled_limit() == 3
+    assert controller.summary() == ("Adaptive concurrency settled at 3 "
+                                    "(range 3-6, 6 adjustments)")
+
+
+def test_breaker_trips_after_threshold_consecutive_failures():
+    """check() raises once `threshold` failures in a row share a reason."""
+    breaker = CircuitBreaker(threshold=3)
+    for _ in range(2):
+        breaker.record_failure(failure("timeout"))
+    breaker.check()
+
+    breaker.record_failure(failure("timeout"))
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.check()
+    assert raised.value.reason == "timeout"
+
+
+def test_breaker_counts_only_identical_reasons():
+    """A different reason in between starts the count again."""
+    breaker = CircuitBreaker(threshold=2)
+    for reason in ["timeout", "agent", "timeout", "agent"]:
+        breaker.record_failure(failure(reason))
+    assert breaker.tripped is None
+
+
+def test_breaker_ignores_other_reasons():
+    """Failures that do not say anything about the setup never trip it."""
+    breaker = CircuitBreaker(threshold=2)
+    for _ in range(5):
+        breaker.record_failure(failure("other"))
+    assert breaker.tripped is None
+
+
+def test_success_resets_the_count():
+    """Failures separated by a success are not consecutive."""
+    breaker = CircuitBreaker(threshold=2)
+    for _ in range(3):
+        breaker.record_failure(failure("no-secret-key"))
+        breaker.record_success()
+    assert breaker.tripped is None
+
+
+def test_reset_closes_the_breaker():
+    """After reset() it takes `threshold` new failures to trip again."""
+    breaker = CircuitBreaker(threshold=2)
+    breaker.record_failure(failure("agent"))
+    breaker.record_failure(failure("agent"))
+    breaker.reset()
+    breaker.check()
+    breaker.record_failure(failure("agent"))
+    assert breaker.tripped is None
+
+
+def test_expected_failures_are_ignored_for_no_secret_key_only():
+    """Expected entries only stay off the count when their key is missing."""
+    breaker = CircuitBreaker(threshold=1)
+    breaker.expect_failures(["team/a"])
+    breaker.record_failure(failure("no-secret-key", "team/a"))
+    assert breaker.tripped is None
+
+    breaker.record_failure(failure("timeout", "team/a"))
+    assert breaker.tripped == "timeout"
+
+
+def test_retry_only_transient_failures():
+    """Timeouts and agent errors are retried; a missing key or success is not."""
+    policy = RetryPolicy(max_attempts=3)
+    assert policy.should_retry(failure("timeout"), 1)
+    assert policy.should_retry(failure("agent"), 2)
+    assert not policy.should_retry(failure("agent"), 3)
+    assert not policy.should_retry(failure("no-secret-key"), 1)
+    assert not policy.should_retry(None, 1)
+
+
+def test_retry_stops_at_the_deadline():
+    """Nothing is retried if the delay would run past the deadline."""
+    policy = RetryPolicy(max_attempts=10, deadline=60)
+    policy.start()
+    assert policy.should_retry(failure("timeout"), 1, delay=1)
+    assert not policy.should_retry(failure("timeout"), 1, delay=61)
+
+
+def test_retry_delay_is_capped():
+    """The jittered delay never exceeds max_delay."""
+    policy = RetryPolicy(base_delay=1, max_delay=4)
+    assert all(0 <= policy.delay(attempt) <= 4 for attempt in range(1, 20))
@@ -0,0 +1,77 @@
+"""Tests for reading recipients from OpenPGP packet headers."""
+import pytest
+
+from openpgp import WILDCARD_KEY_ID, PacketError, recipient_key_ids
+
+KEY_A = "0123456789ABCDEF"
+KEY_B = "FEDCBA9876543210"
+
+
+def pkesk_v3(key_id: str) -> bytes:
+    """Body of a version 3 PKESK packet for `key_id`, with a dummy RSA session key."""
+    return b"\x03" + bytes.fromhex(key_id) + b"\x01" + b"\x00\x08\xff"
+
+
+def new_format(tag: int, body: bytes) -> bytes:
+    """A new-format packet with a one-byte length."""
+    return bytes([0xC0 | tag, len(body)]) + body
+
+
+def old_format(tag: int, body: bytes) -> bytes:
+    """An old-format packet with a two-byte length."""
+    return bytes([0x80 | tag << 2 | 1]) + len(body).to_bytes(2, "big") + body
+
+
+# Symmetrically encrypted integrity-protected data, with a partial body length
+ENCRYPTED_DATA = bytes([0xD2, 0xE9]) + bytes(512) + b"\x05" + bytes(5)
+
+
+def write(tmp_path, data: bytes) -> str:
+    """Write `data` to an entry file and return its path."""
+    path = tmp_path / "entry.gpg"
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_recipients_before_partial_length_data(tmp_path):
+    """Reading stops at the data packet, whose partial length is never decoded."""
+    data = new_format(1, pkesk_v3(KEY_A)) + new_format(1, pkesk_v3(KEY_B)) + ENCRYPTED_DATA
+    assert recipient_key_ids(write(tmp_path, data)) == (KEY_A, KEY_B)
+
+
+def test_old_format_and_marker_packets(tmp_path):
+    """Old-format headers and a leading marker packet are understood."""
+    data = new_format(10, b"PGP") + old_format(1, pkesk_v3(KEY_A)) + ENCRYPTED_DATA
+    assert recipient_key_ids(write(tmp_path, data)) == (KEY_A,)
+
+
+def test_old_format_indeterminate_data(tmp_path):
+    """A data packet of indeterminate length after the recipients is not an error."""
+    data = old_format(1, pkesk_v3(KEY_A)) + bytes([0x80 | 9 << 2 | 3]) + bytes(40)
+    assert recipient_key_ids(write(tmp_path, data)) == (KEY_A,)
+
+
+def test_hidden_recipient(tmp_path):
+    """gpg --throw-keyids writes a wildcard key ID."""
+    data = new_format(1, pkesk_v3(WILDCARD_KEY_ID)) + ENCRYPTED_DATA
+    assert recipient_key_ids(write(tmp_path, data)) == (WILDCARD_KEY_ID,)
+
+
+def test_symmetric_only(tmp_path):
+    """A message encrypted with a passphrase only has no recipients."""
+    data = new_format(3, b"\x04\x09\x03\x08" + bytes(8) + b"\x60") + ENCRYPTED_DATA
+    assert not recipient_key_ids(write(tmp_path, data))
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"-----BEGIN PGP MESSAGE-----\n",
+    new_format(1, pkesk_v3(KEY_A))[:8],
+    new_format(1, b""),
+    new_format(1, b"\x04" + bytes(10)),
+    bytes([0xC1, 0xE9]) + bytes(512),
+])
+def test_malformed_files_raise_packet_error(tmp_path, data):
+    """Empty, armored, truncated and malformed files raise PacketError."""
+    with pytest.raises(PacketError):
+        recipient_key_ids(write(tmp_path, data))
@@ -0,0 +1,205 @@
+"""Tests for parsing entries, against the previous parser and with rules."""
+import importlib.util
+import json
+import os
+import random
+
+import pytest
+
+from parsing import (LineClassifier, ParseRule, PassContent, process_pass, process_pass_many,
+                     url_from_entry_name)
+
+
+def load_benchmark():
+    """Import benchmarks/bench_parse.py, which keeps the previous parser."""
+    path = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "bench_parse.py")
+    spec = importlib.util.spec_from_file_location("bench_parse", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+bench_parse = load_benchmark()
+
+# Lines the previous parser already understood: no URLs or TOTP, which it left in notes
+EDGE_CASES = [
+    "",
+    "only-a-password",
+    "pw\n\n\n",
+    "pw\r\nuser: alice\r\nnote\r\n",
+    "  pw  \n  Username:  bob  \nLOGIN:carol",
+    "pw\nemail: a@example.com\nb@example.com",
+    "pw\nuser: alice@example.com",
+    "pw\na@b:c\nmailto: x@y",
+    "pw\nuser:\nusername:",
+    "pw\nusers: not a prefix\nusername\nlogin name: x",
+    "pw\npin: 1234\nsecurity question: pet? rex",
+    "pw\nüser: ümlaut\nnötë",
+]
+
+
+def previous_parser_corpus(entries: int, seed: int):
+    """Random entries made only of lines the previous parser understood."""
+    templates = [template for template in bench_parse.LINE_TEMPLATES
+                 if not any(word in template.lower()
+                            for word in ("http", "url:", "website:", "otpauth"))]
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(entries):
+        lines = [f"pw-{i}"] + [
+            template.format(word=rng.choice(bench_parse.WORDS), number=rng.randint(0, 9999))
+            for template in rng.choices(templates, k=rng.randint(0, 8))
+        ]
+        corpus.append((f"{rng.choice(bench_parse.WORDS)}/entry-{i}", "\n".join(lines)))
+    return corpus
+
+
+def test_same_as_previous_parser():
+    """Entries without URLs or TOTP parse exactly as they used to."""
+    corpus = previous_parser_corpus(2000, seed=1)
+    corpus += [(f"edge/{i}", raw) for i, raw in enumerate(EDGE_CASES)]
+    for entry_name, raw in corpus:
+        assert process_pass(entry_name, raw) == bench_parse.process_pass_baseline(entry_name, raw)
+
+
+def test_process_pass_many_matches_process_pass():
+    """The batch parser gives the same rows as parsing one entry at a time."""
+    corpus = bench_parse.synthetic_corpus(2000, seed=2)
+    corpus += [(f"edge/{i}", raw) for i, raw in enumerate(EDGE_CASES)]
+    corpus += [("websites/example.com", None), ("empty", "")]
+    columns = process_pass_many(*zip(*corpus))
+    rows = [PassContent(*values) for values in zip(*columns.values())]
+    assert rows == [process_pass(entry_name, raw) for entry_name, raw in corpus]
+
+
+@pytest.mark.parametrize("line, field, value", [
+    ("otpauth://totp/Example:alice@example.com?secret=JBSWY3DPEHPK3PXP&issuer=Example",
+     "totp", "otpauth://totp/Example:alice@example.com?secret=JBSWY3DPEHPK3PXP&issuer=Example"),
+    ("OTPAUTH://TOTP/x?issuer=x&secret=JBSWY3DP", "totp",
+     "OTPAUTH://TOTP/x?issuer=x&secret=JBSWY3DP"),
+    ("otpauth://hotp/x?secret=JBSWY3DP&counter=1", "note",
+     "otpauth://hotp/x?secret=JBSWY3DP&counter=1"),
+    ("otpauth://totp/x?secret=not-base32", "note", "otpauth://totp/x?secret=not-base32"),
+])
+def test_totp_lines(line, field, value):
+    """TOTP URIs are recognized ahead of emails, and only when well formed."""
+    row = process_pass("entry", f"pw\n{line}")
+    assert getattr(row, field) == value
+
+
+@pytest.mark.parametrize("line, field, value", [
+    ("url: https://example.com/login", "url", "https://example.com/login"),
+    ("Website: example.org", "url", "example.org"),
+    ("https://user@example.net/path", "url", "https://user@example.net/path"),
+    ("see https://example.net", "note", "see https://example.net"),
+])
+def test_url_lines(line, field, value):
+    """URLs are recognized ahead of emails, from a prefix or as the whole line."""
+    row = process_pass("entry", f"pw\n{line}")
+    assert getattr(row, field) == value
+
+
+@pytest.mark.parametrize("entry_name, url", [
+    ("websites/example.com/login", "https://example.com"),
+    ("Example.COM", "https://example.com"),
+    ("mail.example.co.uk/alice", "https://mail.example.co.uk"),
+    ("work/gitlab.example.io", "https://gitlab.example.io"),
+    ("bank", None),
+    ("report.pdf", None),
+    ("notes/readme.md", None),
+    ("scripts/deploy.sh", None),
+    ("Bank/acct.no", None),
+    ("example.com.backup", None),
+    ("-bad-.com", None),
+])
+def test_url_from_entry_name(entry_name, url):
+    """Only a path segment ending in a known, unambiguous TLD is a domain."""
+    assert url_from_entry_name(entry_name) == url
+
+
+def test_url_line_takes_precedence_over_entry_name():
+    """A url: line wins over the domain in the name, which is only a fallback."""
+    assert process_pass("example.com", "pw\nurl: other.org").url == "other.org"
+    assert process_pass("example.com", "pw").url == "https://example.com"
+
+
+def parse(lines: str, *rules: ParseRule) -> PassContent:
+    """Parse `lines` after a password with a classifier made of `rules`."""
+    return process_pass("entry", "pw\n" + lines, LineClassifier(rules))
+
+
+def test_prefix_rules():
+    """Prefixes match in any case, with spaces before the colon, as whole prefixes."""
+    rules = (ParseRule("username", ("benutzer", "Kennung")),
+             ParseRule("email", ("e-post",)))
+    assert parse("BENUTZER : hans", *rules).username == "hans"
+    assert parse("kennung:\that", *rules).username == "hat"
+    assert parse("E-Post: hans@example.de", *rules).email == "hans@example.de"
+    assert parse("benutzername: hans", *rules).note == "benutzername: hans"
+
+
+def test_first_rule_listing_a_prefix_wins():
+    """A prefix listed by two rules fills the field of the first one."""
+    row = parse("id: 42", ParseRule("username", ("id",)), ParseRule("note", ("id",)))
+    assert row.username == "42"
+
+
+def test_pattern_rules():
+    """A pattern's `value` group is the value, or else the whole matched line."""
+    rules = (ParseRule("username", pattern=r"ID (?P<value>\d+)"),
+             ParseRule("url", pattern=r"intranet/\S+"))
+    row = parse("ID 1234\nintranet/wiki", *rules)
+    assert (row.username, row.url) == ("1234", "intranet/wiki")
+    assert parse("my ID 1234", *rules).note == "my ID 1234"
+
+
+def test_note_rules_keep_lines_in_notes():
+    """A note rule stops a line from being taken by the built-in classification."""
+    row = parse("backup user: bob@example.com", ParseRule("note", ("backup user",)))
+    assert (row.email, row.note) == (None, "backup user: bob@example.com")
+
+
+def test_rules_take_precedence_over_built_ins():
+    """Rules are tried before the built-in prefixes and the '@' email check."""
+    row = parse("user: alice@example.com", ParseRule("username", ("user",)))
+    assert (row.username, row.email) == ("alice@example.com", None)
+    assert parse("login: carol").username == "carol"
+
+
+@pytest.mark.parametrize("arguments", [
+    ("password", ("pw",)),
+    ("username",),
+    ("username", ("",)),
+    ("username", (), "(unclosed"),
+    ("username", (), "(?P<other>x)"),
+])
+def test_invalid_rules(arguments):
+    """Rules for unknown fields, without anything to match or with bad regexes fail."""
+    with pytest.raises(ValueError):
+        ParseRule(*arguments)
+
+
+def test_load_rules_file(tmp_path):
+    """Rules files list rules as objects; a single prefix may be a string."""
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": [
+        {"field": "username", "prefixes": "benutzer"},
+        {"field": "totp", "pattern": r"2fa (?P<value>\w+)"},
+    ]}), encoding="utf-8")
+    row = process_pass("entry", "pw\nbenutzer: hans\n2fa ABC", LineClassifier.load(str(path)))
+    assert (row.username, row.totp) == ("hans", "ABC")
+
+
+@pytest.mark.parametrize("data", [
+    [],
+    {"rules": {}},
+    {"rules": ["username"]},
+    {"rules": [{"field": "username", "prefix": ["typo"]}]},
+    {"rules": [{"field": "username", "prefixes": [1]}]},
+])
+def test_invalid_rules_file(tmp_path, data):
+    """Malformed rules files raise ValueError."""
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    with pytest.raises(ValueError):
+        LineClassifier.load(str(path))
@@ -0,0 +1,219 @@
+"""Tests for decrypting and processing entries in migrate, with the fake backend."""
+# pylint: disable=protected-access
+import asyncio
+import itertools
+import os
+import sys
+import threading
+
+import pytest
+
+import migrate
+from backends import DecryptionError
+from concurrency import CircuitBreaker, RetryPolicy, RunControl
+from migrate import (_chunked, process_all_entries, process_all_entries_async, read_entries,
+                     schedule_by_recipient)
+from parsing import LineClassifier, ParseRule
+from store import StoreIndex, scan_parallel
+
+NO_SECRET_KEY = "gpg: decryption failed: No secret key"
+NO_AGENT = "gpg: can't connect to the agent: IPC connect call failed"
+
+
+def test_chunked_groups_lazily():
+    """Chunks are taken from the source only as they are needed."""
+    chunks = _chunked(itertools.count(), 3)
+    assert next(chunks) == [0, 1, 2]
+    assert next(chunks) == [3, 4, 5]
+    assert list(_chunked(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert not list(_chunked([], 3))
+
+
+def test_read_entries_keeps_order_across_chunks(tmp_path, fake_backend):
+    """Contents come back in entry order however chunks and workers interleave."""
+    names = [f"entry-{i:02}" for i in range(23)]
+    contents = {name: f"password of {name}" for name in names}
+    backend = fake_backend(contents=contents, batch_size=4)
+
+    assert read_entries(str(tmp_path), iter(names), jobs=4) == [contents[n] for n in names]
+    assert sorted(backend.decrypted) == names
+
+
+def test_read_entries_returns_none_for_failures(tmp_path, fake_backend):
+    """A failed entry is None in place, without affecting the others."""
+    fake_backend(contents={"a": "A", "b": "B", "c": "C"}, errors={"b": "gpg: corrupt"},
+                 batch_size=2)
+
+    assert read_entries(str(tmp_path), ["a", "b", "c"], jobs=2) == ["A", None, "C"]
+
+
+def test_breaker_stops_the_run(tmp_path, fake_backend):
+    """Once the breaker trips, the remaining chunks are not decrypted."""
+    names = [f"e{i}" for i in range(10)]
+    backend = fake_backend(contents={}, errors={name: NO_SECRET_KEY for name in names})
+    control = RunControl(breaker=CircuitBreaker(threshold=3))
+
+    assert read_entries(str(tmp_path), names, control=control) == [None] * 10
+    assert backend.decrypted == names[:3]
+    assert control.breaker.tripped == "no-secret-key"
+
+
+def test_breaker_retries_remaining_entries_when_confirmed(tmp_path, fake_backend):
+    """A confirmed retry reads the failed and unread entries again."""
+    names = ["a", "b", "c", "d", "e"]
+    backend = fake_backend(contents={name: name.upper() for name in names},
+                           errors={"a": [NO_SECRET_KEY], "b": [NO_SECRET_KEY]})
+    asked = []
+
+    def confirm_retry(_error, remaining):
+        asked.append(remaining)
+        return True
+
+    control = RunControl(breaker=CircuitBreaker(threshold=2), confirm_retry=confirm_retry)
+    assert read_entries(str(tmp_path), names, control=control) == ["A", "B", "C", "D", "E"]
+    # a and b failed, c, d and e were never read
+    assert asked == [5]
+    assert backend.decrypted == ["a", "b", "a", "b", "c", "d", "e"]
+
+
+def test_expected_failures_do_not_trip_the_breaker(tmp_path, fake_backend):
+    """Entries known to have no secret key cannot stop the decryptable ones."""
+    doomed = [f"a-team/e{i}" for i in range(6)]
+    readable = [f"personal/e{i}" for i in range(6)]
+    fake_backend(contents={name: "pw" for name in readable},
+                 errors={name: NO_SECRET_KEY for name in doomed})
+    breaker = CircuitBreaker(threshold=5)
+    breaker.expect_failures(doomed)
+
+    contents = read_entries(str(tmp_path), doomed + readable, control=RunControl(breaker=breaker))
+    assert contents == [None] * 6 + ["pw"] * 6
+    assert breaker.tripped is None
+
+
+def test_transient_failures_are_retried(tmp_path, fake_backend):
+    """A gpg-agent hiccup is retried and the entry read on the next attempt."""
+    backend = fake_backend(contents={"a": "A", "b": "B"}, errors={"b": [NO_AGENT]})
+    control = RunControl(retry=RetryPolicy(max_attempts=3, base_delay=0))
+
+    assert read_entries(str(tmp_path), ["a", "b"], control=control) == ["A", "B"]
+    assert backend.decrypted.count("b") == 2
+
+
+def test_retries_stop_after_max_attempts(tmp_path, fake_backend):
+    """An entry that keeps failing transiently is tried max_attempts times."""
+    backend = fake_backend(contents={"b": "B"}, errors={"b": [NO_AGENT] * 5})
+    control = RunControl(retry=RetryPolicy(max_attempts=3, base_delay=0))
+
+    assert read_entries(str(tmp_path), ["b"], control=control) == [None]
+    assert backend.decrypted.count("b") == 3
+
+
+def test_permanent_failures_are_not_retried(tmp_path, fake_backend):
+    """A missing secret key will not go away by trying again."""
+    backend = fake_backend(contents={}, errors={"b": NO_SECRET_KEY})
+    control = RunControl(retry=RetryPolicy(max_attempts=3, base_delay=0))
+
+    assert read_entries(str(tmp_path), ["b"], control=control) == [None]
+    assert backend.decrypted == ["b"]
+
+
+def test_no_retries_once_the_breaker_trips(tmp_path, fake_backend):
+    """Failures that trip the breaker are not retried, but what was read is kept."""
+    names = ["a", "b", "c", "d"]
+    backend = fake_backend(contents={"d": "D"}, errors={name: [NO_AGENT] * 5 for name in names[:3]},
+                           batch_size=4)
+    control = RunControl(breaker=CircuitBreaker(threshold=2),
+                         retry=RetryPolicy(max_attempts=3, base_delay=0))
+
+    assert read_entries(str(tmp_path), names, control=control) == [None, None, None, "D"]
+    assert backend.decrypted == names
+    assert control.breaker.tripped == "agent"
+
+
+def test_process_all_entries_streams_a_parallel_scan(make_store, fake_backend):
+    """Entries streamed from scan_parallel come back as rows in index order."""
+    names = [f"dir{i}/entry{j}" for i in range(3) for j in range(3)] + ["top"]
+    store = make_store({name: f"pw-{name}" for name in names})
+    fake_backend()
+
+    rows, processed, total = process_all_entries(store, jobs=3,
+                                                 entries=scan_parallel(store, workers=3))
+    assert [(row.name, row.password) for row in rows] == [
+        (name, f"pw-{name}") for name in StoreIndex.scan(store).names()]
+    assert processed == total == len(names)
+
+
+def test_schedule_by_recipient_puts_keyless_groups_last(make_store, monkeypatch):
+    """Entries no secret key can open go last and are expected to fail."""
+    store = make_store({"a-team/e1": "", "a-team/e2": "", "personal/e1": "", "top": ""})
+    with open(os.path.join(store, "a-team", ".gpg-id"), "w", encoding="utf-8") as f:
+        f.write("nokey@example.com\n")
+    with open(os.path.join(store, ".gpg-id"), "w", encoding="utf-8") as f:
+        f.write("me@example.com\n")
+    monkeypatch.setattr("migrate.secret_keygrips",
+                        lambda recipient: [] if recipient.startswith("nokey") else ["GRIP"])
+    breaker = CircuitBreaker(threshold=1)
+
+    entries = schedule_by_recipient(StoreIndex.scan(store), breaker=breaker)
+    assert [entry.name for entry in entries] == ["top", "personal/e1", "a-team/e1", "a-team/e2"]
+    breaker.record_failure(DecryptionError("a-team/e1", "failed", "no-secret-key"))
+    assert breaker.tripped is None
+    breaker.record_failure(DecryptionError("top", "failed", "no-secret-key"))
+    assert breaker.tripped == "no-secret-key"
+
+
+def test_duplicates_are_decrypted_once(make_store, fake_backend):
+    """Hard links, symlinks and copies get rows without being decrypted again."""
+    store = make_store({"a": "pw-a\nuser: alice", "b": "pw-b", "copy": "pw-a\nuser: alice"})
+    os.link(os.path.join(store, "a.gpg"), os.path.join(store, "hard.gpg"))
+    os.symlink("a.gpg", os.path.join(store, "soft.gpg"))
+    backend = fake_backend()
+
+    rows, processed, total = process_all_entries(store, backend="fake",
+                                                 entries=StoreIndex.scan(store))
+    assert [row.name for row in rows] == ["a", "b", "copy", "hard", "soft"]
+    assert processed == total == 5
+    assert {row.username for row in rows if row.name != "b"} == {"alice"}
+    assert sorted(backend.decrypted) == ["a", "b"]
+
+
+def test_process_all_entries_parses_with_the_given_classifier(make_store, fake_backend):
+    """Rules apply to the run they are passed to, not to later callers."""
+    store = make_store({"e": "pw\nbenutzer: hans"})
+    fake_backend()
+    classifier = LineClassifier([ParseRule("username", ("benutzer",))])
+
+    rows, _, _ = process_all_entries(store, backend="fake", classifier=classifier)
+    assert rows[0].username == "hans"
+    rows, _, _ = process_all_entries(store, backend="fake")
+    assert rows[0].username is None
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs a POSIX shell")
+def test_process_all_entries_async(make_store, tmp_path, monkeypatch):
+    """Entries are read through pass concurrently, without blocking the event loop."""
+    store = make_store({"b": "pw-b\nuser: bob", "a": "pw-a", "dir/c": "pw-c"})
+    stub = tmp_path / "pass"
+    stub.write_text('#!/bin/sh\ncat "$PASSWORD_STORE_DIR/$1.gpg"\n', encoding="utf-8")
+    stub.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv("PASSWORD_STORE_DIR", store)
+
+    blocking_threads = []
+    scan, pass_env = StoreIndex.scan, migrate.pass_env
+
+    def recorded(function):
+        def call(*args):
+            blocking_threads.append(threading.current_thread())
+            return function(*args)
+        return call
+
+    monkeypatch.setattr(StoreIndex, "scan", recorded(scan))
+    monkeypatch.setattr(migrate, "pass_env", recorded(pass_env))
+
+    rows, processed, total = asyncio.run(process_all_entries_async(store, concurrency=2))
+    assert [(row.name, row.password, row.username) for row in rows] == [
+        ("a", "pw-a", None), ("b", "pw-b", "bob"), ("dir/c", "pw-c", None)]
+    assert processed == total == 3
+    assert len(blocking_threads) == 2
+    assert threading.main_thread() not in blocking_threads
@@ -0,0 +1,267 @@
+"""Tests for walking, filtering and remembering the store."""
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from store import (EntryFilter, PassStore, StoreIndex, StoreManifest, find_duplicates,
+                   git_head, gopass_stores, index_order_key, mount_stores, scan_parallel)
+
+
+def test_scan_order_matches_index_order_key(make_store):
+    """Entries come before subdirectories, both in name order."""
+    store = make_store({"b": "", "a/z": "", "a/b/c": "", "c": "", "a/y": ""})
+    names = StoreIndex.scan(store).names()
+    assert names == ["b", "c", "a/y", "a/z", "a/b/c"]
+    assert sorted(names, key=index_order_key) == names
+
+
+def test_scan_records_stat_data_and_skips_git(make_store):
+    """Entries keep the stat data of the walk; nothing under .git is indexed."""
+    store = make_store({"a": "1", "dir/b": "22", ".git/objects/c": "3"})
+    index = StoreIndex.scan(store)
+    assert index.names() == ["a", "dir/b"]
+    entry = index.get("dir/b")
+    assert (entry.path, entry.size) == (os.path.join(store, "dir", "b.gpg"), 2)
+    assert "dir/b" in index and ".git/objects/c" not in index
+
+
+def test_scan_parallel_finds_what_scan_finds(make_store):
+    """The parallel scan yields the same entries, which from_entries puts in index order."""
+    names = [f"d{i}/s{j}/e{k}" for i in range(4) for j in range(3) for k in range(2)]
+    store = make_store({name: "" for name in names + ["top"]})
+    index = StoreIndex.scan(store)
+    found = list(scan_parallel(store, workers=4))
+    assert sorted(entry.name for entry in found) == sorted(index.names())
+    assert StoreIndex.from_entries(store, found).names() == index.names()
+
+
+def test_find_duplicates(make_store):
+    """Hard links, symlinks and identical copies are duplicates; same size is not enough."""
+    store = make_store({"a": "secret", "copy": "secret", "other": "secrex", "b": "longer"})
+    os.link(os.path.join(store, "a.gpg"), os.path.join(store, "hard.gpg"))
+    os.symlink("a.gpg", os.path.join(store, "soft.gpg"))
+
+    duplicates = find_duplicates(StoreIndex.scan(store))
+    assert duplicates == {"a": ["hard", "soft", "copy"]}
+
+
+def test_find_duplicates_merges_copies_of_linked_files(make_store):
+    """A copy of a hard-linked file joins the same set, under its first entry."""
+    store = make_store({"a": "secret", "b": "secret"})
+    os.link(os.path.join(store, "b.gpg"), os.path.join(store, "c.gpg"))
+
+    assert find_duplicates(StoreIndex.scan(store)) == {"a": ["b", "c"]}
+
+
+def test_scan_does_not_follow_symlinks_back_up(make_store):
+    """A symlinked directory leading to one above it is not walked again."""
+    store = make_store({"dir/a": "", "linked/b": ""})
+    os.symlink("..", os.path.join(store, "dir", "loop"))
+    os.symlink(os.path.join(store, "linked"), os.path.join(store, "dir", "shared"))
+
+    names = ["dir/a", "linked/b", "dir/shared/b"]
+    assert sorted(StoreIndex.scan(store).names()) == sorted(names)
+    assert sorted(entry.name for entry in scan_parallel(store, workers=2)) == sorted(names)
+
+
+def write(store: str, name: str, content: str):
+    """Overwrite an entry's file."""
+    with open(os.path.join(store, name + ".gpg"), "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_manifest_classify(make_store):
+    """Entries are added, changed, unchanged or deleted relative to the record."""
+    store = make_store({"same": "1", "touched": "2", "edited": "3", "gone": "4"})
+    manifest = StoreManifest()
+    index = StoreIndex.scan(store)
+    assert manifest.classify(index).added == index.names()
+    manifest.record(index, index.names())
+
+    os.utime(os.path.join(store, "touched.gpg"), (1, 1))
+    write(store, "edited", "33")
+    os.remove(os.path.join(store, "gone.gpg"))
+    write(store, "new", "5")
+
+    diff = StoreManifest(manifest.entries).classify(StoreIndex.scan(store))
+    assert (diff.added, diff.changed, diff.deleted) == (["new"], ["edited"], ["gone"])
+    assert sorted(diff.unchanged) == ["same", "touched"]
+    assert diff.summary() == "1 added, 1 changed, 2 unchanged, 1 deleted"
+
+
+def test_manifest_save_and_load(tmp_path, make_store):
+    """A saved manifest loads back the same, and a missing one loads empty."""
+    index = StoreIndex.scan(make_store({"a": "1", "dir/b": "2"}))
+    manifest = StoreManifest(commit="abc123")
+    manifest.record(index, index.names())
+    path = str(tmp_path / "state" / "manifest.json")
+    manifest.save(path)
+
+    loaded = StoreManifest.load(path)
+    assert (loaded.entries, loaded.commit) == (manifest.entries, "abc123")
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert not StoreManifest.load(str(tmp_path / "missing.json")).entries
+
+
+def test_record_keeps_unchanged_entries_as_recorded(make_store):
+    """Entries carried over without being read keep their old data."""
+    store = make_store({"a": "1", "b": "2"})
+    index = StoreIndex.scan(store)
+    manifest = StoreManifest()
+    manifest.record(index, index.names())
+    recorded = dict(manifest.entries)
+
+    write(store, "a", "11")
+    write(store, "b", "22")
+    fresh = StoreManifest(dict(recorded))
+    fresh.record(StoreIndex.scan(store), ["b"], unchanged=["a"])
+    assert fresh.entries["a"] == recorded["a"]
+    assert fresh.entries["b"]["sha256"] != recorded["b"]["sha256"]
+
+
+def git(repository: str, *args: str):
+    """Run a git command in `repository` as a test user."""
+    subprocess.run(["git", "-C", repository, "-c", "user.name=test", "-c",
+                    "user.email=test@example.com", *args],
+                   check=True, capture_output=True)
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+@pytest.mark.parametrize("nested", [False, True])
+def test_manifest_classify_git(make_store, nested):
+    """Changes come from git diff since the recorded commit, without hashing."""
+    store = make_store({"a": "1", "b": "2"})
+    # A nested store is a directory below the root of the repository
+    repository = os.path.dirname(store) if nested else store
+
+    git(repository, "init", "-q")
+    git(repository, "add", ".")
+    git(repository, "commit", "-q", "-m", "initial")
+    index = StoreIndex.from_git(store)
+    manifest = StoreManifest(commit=git_head(store))
+    manifest.record(index, index.names())
+
+    write(store, "b", "22")
+    write(store, "c", "3")
+    git(repository, "add", ".")
+    git(repository, "commit", "-q", "-m", "change")
+    diff = manifest.classify_git(StoreIndex.from_git(store))
+    assert (diff.added, diff.changed, diff.unchanged) == (["c"], ["b"], ["a"])
+
+    assert StoreManifest(manifest.entries, commit="0" * 40).classify_git(index) is None
+    assert StoreManifest(manifest.entries).classify_git(index) is None
+
+
+@pytest.mark.parametrize("include, exclude, name, covered", [
+    ((), (), "anything/at/all", True),
+    (("work/**",), (), "work/a", True),
+    (("work/**",), (), "work/deep/down/a", True),
+    (("work/**",), (), "personal/a", False),
+    (("*/db",), (), "work/db", True),
+    (("*/db",), (), "work/sub/db", False),
+    (("**/db",), (), "work/sub/db", True),
+    ((), ("work/**",), "work/a", False),
+    ((), ("work/**",), "personal/a", True),
+    (("re:^w.*k/",), (), "work/a", True),
+    (("re:bank",), (), "personal/my-bank", True),
+    (("work/**",), ("re:old",), "work/old-vpn", False),
+])
+def test_entry_filter_matches(include, exclude, name, covered):
+    """Globs match whole names segment by segment; regexes search anywhere."""
+    assert EntryFilter(include, exclude).matches(name) is covered
+
+
+@pytest.mark.parametrize("include, exclude, directory, may_contain", [
+    (("work/**",), (), "work", True),
+    (("work/**",), (), "work/deep", True),
+    (("work/**",), (), "personal", False),
+    (("work/db",), (), "work", True),
+    (("work/db",), (), "work/sub", False),
+    (("*/db",), (), "anything", True),
+    (("**/db",), (), "any/depth", True),
+    ((), ("archive/**",), "archive", False),
+    ((), ("archive/*",), "archive", True),
+    (("re:work",), (), "personal", True),
+])
+def test_entry_filter_may_contain(include, exclude, directory, may_contain):
+    """Only directories no covered entry can be below are pruned."""
+    assert EntryFilter(include, exclude).may_contain(directory) is may_contain
+
+
+def test_scan_does_not_descend_into_pruned_directories(make_store, monkeypatch):
+    """Excluded and out-of-scope directories are never listed."""
+    store = make_store({"work/a": "", "work/deep/b": "", "personal/c": "",
+                        "archive/old/d": "", "top": ""})
+    listed = []
+    scandir = os.scandir
+
+    def recording_scandir(path):
+        listed.append(os.path.relpath(path, store))
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", recording_scandir)
+    index = StoreIndex.scan(store, EntryFilter(["work/**", "archive/**"], ["archive/**"]))
+    assert index.names() == ["work/a", "work/deep/b"]
+    assert sorted(listed) == [".", "work", "work/deep"]
+
+
+def test_scan_parallel_applies_the_filter(make_store):
+    """The parallel scan leaves out the same entries and directories as scan()."""
+    store = make_store({"work/a": "", "work/old/b": "", "personal/c": "", "top": ""})
+    entry_filter = EntryFilter(["work/**"], ["work/old/**"])
+    found = StoreIndex.from_entries(store, scan_parallel(store, 2, entry_filter))
+    assert found.names() == StoreIndex.scan(store, entry_filter).names() == ["work/a"]
+
+
+def test_record_drops_failed_entries_and_keeps_unfiltered_ones(make_store):
+    """Covered entries not recorded again are dropped; uncovered ones are kept."""
+    store = make_store({"work/a": "1", "work/b": "2", "home/c": "3"})
+    manifest = StoreManifest()
+    full = StoreIndex.scan(store)
+    manifest.record(full, full.names())
+
+    work = StoreIndex.scan(store, EntryFilter(["work/**"]))
+    manifest.record(work, ["work/a"])
+    assert sorted(manifest.entries) == ["home/c", "work/a"]
+
+
+def test_gopass_stores(tmp_path, monkeypatch):
+    """The root store and every mount are read, the root falling back to gopass's default."""
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    config = tmp_path / "config"
+    config.write_text('[core]\n\tautosync = true\n'
+                      '[mounts "work"]\n\tpath = /stores/work\n'
+                      '; [mounts "old"] path = /stores/old\n'
+                      '[mounts]\n\tpath = "/stores/main"\n', encoding="utf-8")
+    assert gopass_stores(str(config)) == [PassStore("/stores/main", "root"),
+                                          PassStore("/stores/work", "work")]
+
+    config.write_text('[mounts "work"]\n\tpath = /stores/work\n', encoding="utf-8")
+    assert gopass_stores(str(config)) == [PassStore("/stores/work", "work")]
+    root = tmp_path / "data" / "gopass" / "stores" / "root"
+    root.mkdir(parents=True)
+    assert gopass_stores(str(config)) == [PassStore(str(root), "root"),
+                                          PassStore("/stores/work", "work")]
+
+    with pytest.raises(OSError):
+        gopass_stores(str(tmp_path / "missing"))
+
+
+def test_mount_stores(tmp_path, make_store):
+    """Each store is linked under its vault, and the links index every store at once."""
+    store = make_store({"a": "", "dir/b": ""})
+    directory = tmp_path / "mounts"
+    directory.mkdir()
+    (directory / "notes.txt").write_text("kept", encoding="utf-8")
+    os.symlink(str(tmp_path), str(directory / "stale"))
+
+    mounts = mount_stores([PassStore(store, "Work/Team"), PassStore(store, "Work/Team"),
+                           PassStore(store)], str(directory))
+    assert mounts == {"Work-Team": PassStore(store, "Work/Team"),
+                      "Work-Team-2": PassStore(store, "Work/Team"),
+                      "store": PassStore(store, "store")}
+    assert sorted(os.listdir(directory)) == ["Work-Team", "Work-Team-2", "notes.txt", "store"]
+    assert StoreIndex.scan(str(directory)).names() == [
+        f"{mount}/{name}" for mount in mounts for name in ["a", "dir/b"]]
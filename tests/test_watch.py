@@ -0,0 +1,88 @@
+"""Tests for following store changes with inotify."""
+import os
+import sys
+
+import pytest
+
+from store import EntryFilter, StoreIndex
+from watch import StoreWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"),
+                                reason="inotify is only available on Linux")
+
+
+class Stop(Exception):
+    """Raised from on_change to end StoreWatcher.run()."""
+
+
+def next_change(watcher: StoreWatcher):
+    """The (changed, deleted) entry names of the next burst of changes."""
+    calls = []
+
+    def on_change(changed, deleted):
+        calls.append((sorted(changed), sorted(deleted)))
+        raise Stop
+
+    with pytest.raises(Stop):
+        watcher.run(on_change, debounce=0.1)
+    return calls[0]
+
+
+def write(store: str, name: str, content: str):
+    """Write an entry's file, creating its directory if needed."""
+    path = os.path.join(store, name + ".gpg")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+@pytest.fixture(name="watched")
+def fixture_watched(make_store):
+    """Return watch(entries, entry_filter=None) -> (store, StoreWatcher), closed afterwards."""
+    watchers = []
+
+    def watch(entries, entry_filter=None):
+        store = make_store(entries)
+        names = StoreIndex.scan(store, entry_filter).names()
+        watchers.append(StoreWatcher(store, names, entry_filter))
+        return store, watchers[-1]
+
+    yield watch
+    for watcher in watchers:
+        watcher.close()
+
+
+def test_written_and_deleted_entries(watched):
+    """A burst of writes and deletes is reported once, with the names kept up to date."""
+    store, watcher = watched({"a": "1", "dir/b": "2", "c": "3"})
+    write(store, "a", "11")
+    write(store, "dir/new", "4")
+    os.remove(os.path.join(store, "c.gpg"))
+    with open(os.path.join(store, "notes.txt"), "w", encoding="utf-8") as f:
+        f.write("not an entry")
+
+    assert next_change(watcher) == (["a", "dir/new"], ["c"])
+    assert sorted(watcher.names) == ["a", "dir/b", "dir/new"]
+
+
+def test_directories_created_and_moved_away(watched, tmp_path):
+    """Entries below a new directory are added; those below a moved one are deleted."""
+    store, watcher = watched({"old/a": "1", "old/deep/b": "2", "top": "3"})
+    write(store, "new/deep/c", "4")
+    assert next_change(watcher) == (["new/deep/c"], [])
+
+    os.rename(os.path.join(store, "old"), str(tmp_path / "moved"))
+    write(store, "new/deep/d", "5")
+    assert next_change(watcher) == (["new/deep/d"], ["old/a", "old/deep/b"])
+    assert sorted(watcher.names) == ["new/deep/c", "new/deep/d", "top"]
+
+
+def test_changes_outside_the_filter_are_ignored(watched):
+    """Entries the filter does not cover never show up as changes."""
+    store, watcher = watched({"work/a": "1", "personal/b": "2"}, EntryFilter(["work/**"]))
+    write(store, "personal/b", "22")
+    write(store, "personal/c", "3")
+    write(store, "work/a", "11")
+
+    assert next_change(watcher) == (["work/a"], [])
+    assert watcher.names == {"work/a"}
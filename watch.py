@@ -0,0 +1,225 @@
+"""Following changes to a pass store with Linux inotify."""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from store import EntryFilter
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event: wd, mask, cookie, len, then `len` bytes of NUL-padded name
+_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal ctypes binding of the Linux inotify API."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        try:
+            self._libc_add_watch = libc.inotify_add_watch
+            self._libc_rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init1
+        except AttributeError as e:
+            raise OSError("inotify is only available on Linux") from e
+        self._libc_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._libc_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+        self.fd = init(IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1: {os.strerror(error)}")
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        """Watch a directory, returning its watch descriptor."""
+        wd = self._libc_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        """Stop watching; the kernel then sends IN_IGNORED for `wd`."""
+        self._libc_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: Optional[float] = None) -> List[Tuple[int, int, str]]:
+        """
+        Wait up to `timeout` seconds (forever if None) for events.
+
+        Returns (watch descriptor, mask, name) tuples, or an empty list on
+        timeout.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        """Release the inotify instance and all its watches."""
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StoreWatcher:
+    """
+    Keep track of a store's entries and report which ones change.
+
+    Every directory of the store (except `.git`, and those `entry_filter`
+    prunes) gets an inotify watch, including symlinked ones such as the
+    stores of a multi-store run. A written, moved-in or deleted `.gpg`
+    file changes one entry. A directory created, moved in or moved away
+    changes every entry below it, which is why the watcher keeps the set of
+    entry names. If the kernel's event queue overflows, the whole store is
+    walked again.
+    """
+
+    def __init__(self, pass_store_path: str, names: Iterable[str],
+                 entry_filter: Optional[EntryFilter] = None):
+        self.pass_store_path = pass_store_path
+        self.names: Set[str] = set(names)
+        self.entry_filter = entry_filter
+        self._inotify = Inotify()
+        # Watch descriptor -> store-relative directory ("" for the root)
+        self._directories: Dict[int, str] = {}
+        self._watch_tree("")
+
+    def close(self):
+        """Remove all watches."""
+        self._inotify.close()
+
+    def _covers(self, name: str) -> bool:
+        return not self.entry_filter or self.entry_filter.matches(name)
+
+    def _watch_tree(self, directory: str) -> Set[str]:
+        """Watch `directory` and everything below it, returning the entries found."""
+        found = set()
+        walked = set()
+        top = os.path.join(self.pass_store_path, directory)
+        for root, subdirectories, files in os.walk(top, followlinks=True):
+            # Symlinked directories are followed, but each real directory only once
+            real_root = os.path.realpath(root)
+            if real_root in walked:
+                subdirectories[:] = []
+                continue
+            walked.add(real_root)
+            relative_root = os.path.relpath(root, self.pass_store_path)
+            relative_root = "" if relative_root == "." else relative_root
+            try:
+                self._directories[self._inotify.add_watch(root)] = relative_root
+            except OSError as e:
+                print(f"Could not watch {root}: {e}")
+            subdirectories[:] = [
+                d for d in subdirectories
+                if d != ".git" and (not self.entry_filter
+                                    or self.entry_filter.may_contain(
+                                        os.path.join(relative_root, d)))
+            ]
+            names = (os.path.join(relative_root, f)[:-4] for f in files if f.endswith(".gpg"))
+            found.update(name for name in names if self._covers(name))
+        return found
+
+    def _unwatch_tree(self, directory: str) -> Set[str]:
+        """Forget `directory` and everything below it, returning the entries dropped."""
+        prefix = directory + "/"
+        for wd, watched in list(self._directories.items()):
+            if watched == directory or watched.startswith(prefix):
+                self._inotify.rm_watch(wd)
+                del self._directories[wd]
+        return {name for name in self.names if name.startswith(prefix)}
+
+    def _rescan(self) -> Tuple[Set[str], Set[str]]:
+        for wd in list(self._directories):
+            self._inotify.rm_watch(wd)
+        self._directories.clear()
+        found = self._watch_tree("")
+        return found, self.names - found
+
+    def _entry_changes(self, wd: int, mask: int,
+                       name: str) -> Optional[Tuple[Set[str], Set[str]]]:
+        """Entries one event adds (or rewrites) and removes, or None if it changes none."""
+        path = os.path.join(self._directories[wd], name)
+        if mask & IN_ISDIR:
+            if name == ".git":
+                return None
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                return self._watch_tree(path), set()
+            if mask & IN_MOVED_FROM:
+                return set(), self._unwatch_tree(path)
+        elif name.endswith(".gpg") and self._covers(path[:-4]):
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                return {path[:-4]}, set()
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                return set(), {path[:-4]}
+        return None
+
+    def _apply(self, events: List[Tuple[int, int, str]],
+               changed: Set[str], deleted: Set[str]):
+        """Fold a batch of events into the sets of changed and deleted entries."""
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                print("inotify queue overflowed, rescanning the store")
+                added, removed = self._rescan()
+            elif mask & IN_IGNORED or wd not in self._directories:
+                self._directories.pop(wd, None)
+                continue
+            else:
+                changes = self._entry_changes(wd, mask, name)
+                if changes is None:
+                    continue
+                added, removed = changes
+
+            changed.difference_update(removed)
+            deleted.update(removed)
+            changed.update(added)
+            deleted.difference_update(added)
+            self.names.difference_update(removed)
+            self.names.update(added)
+
+    def run(self, on_change: Callable[[Set[str], Set[str]], None], debounce: float = 0.5):
+        """
+        Call on_change(changed, deleted) with entry names after each burst of changes.
+
+        A burst ends once the store has been quiet for `debounce` seconds, so
+        a git pull touching many entries is handled in one call. Runs until
+        interrupted.
+        """
+        while True:
+            changed: Set[str] = set()
+            deleted: Set[str] = set()
+            self._apply(self._inotify.read_events(), changed, deleted)
+            quiet_since = time.monotonic()
+            while time.monotonic() - quiet_since < debounce:
+                events = self._inotify.read_events(debounce)
+                if events:
+                    self._apply(events, changed, deleted)
+                    quiet_since = time.monotonic()
+            if changed or deleted:
+                on_change(changed, deleted)